@@ -1,21 +1,147 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
 import logging
 import asyncio
-from operate.operate import operate
-from operate.models.apis import get_next_action
+import threading
+import time
+from contextlib import asynccontextmanager
+from operate.operate import operate, operating_system, run_objective_async
+from operate.models.apis import get_last_labels, get_next_action
+from operate.models.limiter import current_caller, get_governor
+from operate.models.local_planner import plan_locally
+from operate.exceptions import (
+    InvalidActionException,
+    ModelOverloadedException,
+    SessionLimitException,
+)
+from operate.action import Action, to_dicts
+from operate.session import SessionPool
+from operate.models.prompts import get_system_prompt
+from operate.models.vision import get_ocr_reader, get_yolo_model
+from operate.utils.screenshot import grab_screen
 from operate.config import Config
+from operate.utils.frame_buffer import start_frame_buffer, stop_frame_buffer
+from operate.utils.plan import ExecutionTimeline
+from operate.utils.xvfb import Xvfb
+from operate.utils.metrics import JOBS_IN_FLIGHT, render_metrics
+from operate.utils.artifacts import close_artifact_store
 import json
+import os
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="MJAK Automation API", description="API for MJAK Operating System Automation")
+# Initialize config
+config = Config()
+
+# Component -> "pending" | "ready" | error message, see /ready
+readiness = {}
+
+# Sessions on their own virtual displays, enabled with MJAK_SESSIONS=N
+session_pool = None
+
+# Without sessions every automation shares the desktop, run them one at a time
+desktop_lock = asyncio.Lock()
+
+# Seconds before a failed warm-up step is retried, doubled up to the maximum,
+# and the attempts after which it is reported as failed
+WARM_UP_RETRY = 1.0
+WARM_UP_MAX_RETRY = 60.0
+WARM_UP_ATTEMPTS = 6
+
+def warm_up(stopped=None, sessions=False):
+    """
+    Loads everything the first request would otherwise pay for: the Gemini
+    client, the prompt templates, the capture and input backends and, with
+    MJAK_WARM_VISION=1, the YOLO and OCR models. With `sessions` requests
+    run on the sessions' own displays, the desktop capture and input are
+    skipped. Failed steps are retried with a backoff, up to
+    WARM_UP_ATTEMPTS times or until `stopped` is set.
+    """
+    stopped = stopped or threading.Event()
+    steps = {
+        "model_client": config.get_google_model,
+        "prompts": lambda: get_system_prompt("gemini-1.5-flash", ""),
+    }
+    if not sessions:
+        steps["capture"] = grab_screen
+        steps["input"] = lambda: operating_system.backend
+    if os.getenv("MJAK_WARM_VISION") == "1":
+        steps["yolo"] = get_yolo_model
+        steps["ocr"] = get_ocr_reader
+    readiness.update({name: "pending" for name in steps})
+    delay = WARM_UP_RETRY
+    for attempt in range(1, WARM_UP_ATTEMPTS + 1):
+        for name, step in list(steps.items()):
+            started = time.perf_counter()
+            try:
+                step()
+                readiness[name] = "ready"
+                del steps[name]
+                logger.info(f"Warmed up {name} in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                if attempt == WARM_UP_ATTEMPTS:
+                    readiness[name] = f"failed: {e}"
+                    logger.error(f"Failed to warm up {name} after {attempt} attempts: {e}")
+                else:
+                    readiness[name] = f"error: {e}"
+                    logger.error(f"Failed to warm up {name}, retrying in {delay:.0f}s: {e}")
+        if not steps or attempt == WARM_UP_ATTEMPTS or stopped.wait(delay):
+            return
+        delay = min(delay * 2, WARM_UP_MAX_RETRY)
+
+@asynccontextmanager
+async def lifespan(app):
+    global session_pool
+    capture_fps = float(os.getenv("MJAK_CAPTURE_FPS", "0"))
+    if capture_fps > 0:
+        logger.info(f"Starting background screen capture at {capture_fps} fps")
+        start_frame_buffer(fps=capture_fps)
+    max_sessions = int(os.getenv("MJAK_SESSIONS", "0"))
+    if max_sessions > 0:
+        virtual_displays = Xvfb.available()
+        if not virtual_displays:
+            logger.warning("Xvfb is not installed, sessions share the current desktop")
+        logger.info(f"Enabling up to {max_sessions} automation sessions")
+        session_pool = SessionPool(
+            max_sessions,
+            idle_timeout=float(os.getenv("MJAK_SESSION_IDLE_TIMEOUT", "300")),
+            virtual_displays=virtual_displays,
+            capture_fps=capture_fps,
+        ).start_reaper()
+    if os.getenv("MJAK_WATCH_SETTINGS") == "1":
+        logger.info(f"Watching {config.settings_path} for settings changes")
+        config.watch_settings()
+    # Warm up in the background so /health answers immediately, /ready
+    # flips once everything is loaded
+    warm_up_stopped = threading.Event()
+    warm_up_task = asyncio.create_task(
+        asyncio.to_thread(warm_up, warm_up_stopped, session_pool is not None)
+    )
+    try:
+        yield
+    finally:
+        warm_up_stopped.set()
+        warm_up_task.cancel()
+        if session_pool is not None:
+            session_pool.close()
+            session_pool = None
+        stop_frame_buffer()
+        config.stop_watching_settings()
+        # Flush the artifact writes still queued
+        close_artifact_store()
+
+app = FastAPI(
+    title="MJAK Automation API",
+    description="API for MJAK Operating System Automation",
+    lifespan=lifespan,
+)
 
 # Configure CORS for React frontend
 app.add_middleware(
@@ -26,14 +152,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize config
-config = Config()
-
 class AutomateAction(BaseModel):
     operation: str
     thought: Optional[str] = None
     x: Optional[str] = None
     y: Optional[str] = None
+    # Set-of-marks label of a click, resolved with the last labeled screenshot
+    label: Optional[str] = None
     keys: Optional[List[str]] = None
     content: Optional[str] = None
     summary: Optional[str] = None
@@ -41,30 +166,129 @@ class AutomateAction(BaseModel):
 class AutomateRequest(BaseModel):
     actions: List[AutomateAction]
     objective: str
+    sessionId: Optional[str] = None
 
 class GenerateActionsRequest(BaseModel):
     objective: str
+    sessionId: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    objectives: List[str]
+    sessionId: Optional[str] = None
+    # Skip the remaining objectives once one does not complete
+    stopOnFailure: bool = False
 
 class AutomateResponse(BaseModel):
     success: bool
     message: str
     executedActions: Optional[int] = None
     error: Optional[str] = None
+    sessionId: Optional[str] = None
+    # Per executed action: operation, whether the screen changed, retries
+    actionResults: Optional[List[Dict[str, Any]]] = None
 
 class GenerateActionsResponse(BaseModel):
     success: bool
     actions: List[Dict[str, Any]]
     message: Optional[str] = None
     error: Optional[str] = None
+    sessionId: Optional[str] = None
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "MJAK Automation API"}
 
+@app.get("/ready")
+async def ready_check():
+    """Readiness probe, 503 until every resource has been warmed up"""
+    if readiness and all(state == "ready" for state in readiness.values()):
+        return {"status": "ready", "components": readiness}
+    failed = any(state.startswith("failed") for state in readiness.values())
+    return JSONResponse(
+        status_code=503,
+        content={"status": "failed" if failed else "warming", "components": readiness},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latency histograms and error counters in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def caller_id(http_request: Request) -> str:
+    """Identify the client for fair queuing of model calls"""
+    client_id = http_request.headers.get("X-Client-Id")
+    if client_id:
+        return client_id
+    return http_request.client.host if http_request.client else "unknown"
+
+async def acquire_session(session_id: Optional[str]):
+    """Acquire the requested session, or any free one, when sessions are enabled"""
+    if session_pool is None:
+        if session_id:
+            raise HTTPException(status_code=404, detail="Sessions are not enabled, set MJAK_SESSIONS")
+        return None
+    try:
+        return await asyncio.to_thread(session_pool.acquire, session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    except SessionLimitException as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.post("/sessions")
+async def create_session():
+    """Start a new session on its own virtual display"""
+    if session_pool is None:
+        raise HTTPException(status_code=404, detail="Sessions are not enabled, set MJAK_SESSIONS")
+    try:
+        session = await asyncio.to_thread(session_pool.create)
+    except SessionLimitException as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start session: {str(e)}")
+    return session.info()
+
+@app.get("/sessions")
+async def list_sessions():
+    """List the running sessions"""
+    if session_pool is None:
+        return {"sessions": []}
+    return {"sessions": [session.info() for session in session_pool.sessions()]}
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Get a session with its step history"""
+    try:
+        session = session_pool.get(session_id) if session_pool else None
+    except KeyError:
+        session = None
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return {**session.info(), "history": list(session.history)}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Stop a session and its virtual display"""
+    try:
+        await asyncio.to_thread(session_pool.remove, session_id)
+    except (AttributeError, KeyError):
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return {"sessionId": session_id, "status": "closed"}
+
 @app.post("/generate-actions", response_model=GenerateActionsResponse)
-async def generate_actions(request: GenerateActionsRequest):
+async def generate_actions(request: GenerateActionsRequest, http_request: Request):
     """Generate automation actions for a given objective using Gemini AI"""
+    with JOBS_IN_FLIGHT.track_in_progress(endpoint="generate-actions"):
+        current_caller.set(caller_id(http_request))
+        session = await acquire_session(request.sessionId)
+        try:
+            return await _generate_actions(request, session)
+        finally:
+            if session is not None:
+                session_pool.release(session)
+
+async def _generate_actions(request: GenerateActionsRequest, session=None):
+    session_id = session.id if session is not None else None
     try:
         logger.info(f"Generating actions for objective: {request.objective}")
         
@@ -75,85 +299,140 @@ async def generate_actions(request: GenerateActionsRequest):
         system_message = {"role": "system", "content": f"Generate automation actions for: {request.objective}"}
         messages = [system_message]
         
+        # Trivial objectives are compiled locally, no screenshot or model call
+        if config.settings.local_planner:
+            local_operations = plan_locally(request.objective)
+            if local_operations:
+                logger.info(f"Planned {len(local_operations)} actions locally")
+                return GenerateActionsResponse(
+                    success=True,
+                    actions=to_dicts(local_operations),
+                    message=f"Generated {len(local_operations)} automation actions locally",
+                    sessionId=session_id
+                )
+        
+        # Shed load before capturing anything when the model queue is full
+        get_governor(config.settings).check()
+        
         # Use the existing get_next_action function to generate actions
-        operations, session_id = await get_next_action("gemini-1.5-flash", messages, request.objective, None)
+        operations, _ = await get_next_action(
+            "gemini-1.5-flash", messages, request.objective, None, session
+        )
         
         if not operations:
             return GenerateActionsResponse(
                 success=False,
                 actions=[],
-                error="No actions could be generated for this objective"
+                error="No actions could be generated for this objective",
+                sessionId=session_id
             )
         
         logger.info(f"Generated {len(operations)} actions")
         return GenerateActionsResponse(
             success=True,
-            actions=operations,
-            message=f"Generated {len(operations)} automation actions"
+            actions=to_dicts(operations),
+            message=f"Generated {len(operations)} automation actions",
+            sessionId=session_id
         )
         
+    except ModelOverloadedException as e:
+        logger.warning(f"Shedding generate-actions request: {str(e)}")
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+            content={
+                "success": False,
+                "actions": [],
+                "message": None,
+                "error": f"Model is overloaded, retry in {e.retry_after}s: {str(e)}",
+                "sessionId": session_id
+            }
+        )
     except Exception as e:
         logger.error(f"Error generating actions: {str(e)}")
         return GenerateActionsResponse(
             success=False,
             actions=[],
-            error=f"Failed to generate actions: {str(e)}"
+            error=f"Failed to generate actions: {str(e)}",
+            sessionId=session_id
         )
 
 @app.post("/automate", response_model=AutomateResponse)
 async def execute_automation(request: AutomateRequest):
     """Execute automation actions on the system"""
+    with JOBS_IN_FLIGHT.track_in_progress(endpoint="automate"):
+        session = await acquire_session(request.sessionId)
+        if session is None:
+            async with desktop_lock:
+                return await asyncio.to_thread(_execute_automation, request)
+        try:
+            return await asyncio.to_thread(_execute_automation, request, session)
+        finally:
+            session_pool.release(session)
+
+def action_results(timeline: ExecutionTimeline) -> List[Dict[str, Any]]:
+    """Summarize the verification of each executed action"""
+    return [
+        {"operation": entry["operation"], "changed": entry["changed"], "retries": entry["retries"]}
+        for entry in timeline.entries
+        if entry["operation"] != "wait"
+    ]
+
+def _execute_automation(request: AutomateRequest, session=None):
+    session_id = session.id if session is not None else None
     try:
         logger.info(f"Executing automation for objective: {request.objective}")
         logger.info(f"Number of actions to execute: {len(request.actions)}")
         
-        # Convert Pydantic models to dictionaries for the operate function
-        operations = []
-        for action in request.actions:
-            operation_dict = {"operation": action.operation}
-            
-            if action.thought:
-                operation_dict["thought"] = action.thought
-            if action.x:
-                operation_dict["x"] = action.x
-            if action.y:
-                operation_dict["y"] = action.y
-            if action.keys:
-                operation_dict["keys"] = action.keys
-            if action.content:
-                operation_dict["content"] = action.content
-            if action.summary:
-                operation_dict["summary"] = action.summary
-                
-            operations.append(operation_dict)
-        
-        # Execute the operations using the existing operate function
-        executed_count = 0
-        for i, operation in enumerate(operations):
-            try:
-                logger.info(f"Executing operation {i+1}/{len(operations)}: {operation.get('operation')}")
-                
-                # Execute the operation
-                stop = operate([operation], "gemini-1.5-flash")
-                executed_count += 1
-                
-                # If operation indicates completion, break
-                if stop:
-                    break
-                    
-            except Exception as e:
-                logger.error(f"Error executing operation {i+1}: {str(e)}")
-                return AutomateResponse(
-                    success=False,
-                    message=f"Failed to execute operation {i+1}: {str(e)}",
-                    executedActions=executed_count,
-                    error=str(e)
-                )
+        # Validate every action before executing any of them
+        labels = session.last_labels if session is not None else get_last_labels()
+        try:
+            operations = [
+                Action.from_dict(action.model_dump(exclude_none=True), labels)
+                for action in request.actions
+            ]
+        except InvalidActionException as e:
+            logger.error(f"Invalid action: {str(e)}")
+            return AutomateResponse(
+                success=False,
+                message=f"Invalid action: {str(e)}",
+                executedActions=0,
+                error=str(e),
+                sessionId=session_id
+            )
+
+        # Execute the whole plan at once so it can be compiled, settle
+        # waits are only inserted after expected UI transitions
+        timeline = ExecutionTimeline()
+        try:
+            operate(operations, "gemini-1.5-flash", timeline=timeline, session=session)
+        except Exception as e:
+            if session is not None:
+                session.record_step(request.objective, operations, timeline)
+            executed_count = timeline.executed_operations
+            logger.error(f"Error executing operation {executed_count + 1}: {str(e)}")
+            return AutomateResponse(
+                success=False,
+                message=f"Failed to execute operation {executed_count + 1}: {str(e)}",
+                executedActions=executed_count,
+                error=str(e),
+                sessionId=session_id,
+                actionResults=action_results(timeline)
+            )
+        if session is not None:
+            session.record_step(request.objective, operations, timeline)
+        executed_count = timeline.executed_operations
+        logger.info(
+            f"Executed {executed_count} operations in {timeline.total_actual:.2f}s "
+            f"(expected {timeline.total_expected:.2f}s)"
+        )
         
         return AutomateResponse(
             success=True,
             message=f"Successfully executed automation for: {request.objective}",
-            executedActions=executed_count
+            executedActions=executed_count,
+            sessionId=session_id,
+            actionResults=action_results(timeline)
         )
         
     except Exception as e:
@@ -161,9 +440,82 @@ async def execute_automation(request: AutomateRequest):
         return AutomateResponse(
             success=False,
             message="Failed to execute automation",
-            error=str(e)
+            error=str(e),
+            sessionId=session_id
         )
 
+@app.post("/batch")
+async def run_batch(request: BatchRequest, http_request: Request):
+    """Run a list of objectives in order on one session, streaming one JSON line per objective"""
+    if not request.objectives:
+        raise HTTPException(status_code=422, detail="No objectives given")
+    current_caller.set(caller_id(http_request))
+    session = await acquire_session(request.sessionId)
+    return StreamingResponse(_run_batch(request, session), media_type="application/x-ndjson")
+
+def objective_result(index: int, objective: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize a run_objective result for the batch stream"""
+    return {
+        "index": index,
+        "objective": objective,
+        "completed": result["completed"],
+        "steps": result["steps"],
+        "error": str(result["error"]) if result["error"] is not None else None,
+        "sources": result["sources"],
+        "timings": result["timings"],
+    }
+
+async def _run_batch(request: BatchRequest, session=None):
+    session_id = session.id if session is not None else None
+    started = time.perf_counter()
+    completed = 0
+    skipped = 0
+    # First step of the next objective, planned while the previous one
+    # finished (see run_objective)
+    prefetch = None
+    with JOBS_IN_FLIGHT.track_in_progress(endpoint="batch"):
+        if session is None:
+            # Without sessions the batch owns the desktop until it is done
+            await desktop_lock.acquire()
+        try:
+            config.validation()
+            logger.info(f"Running a batch of {len(request.objectives)} objectives")
+            objectives = request.objectives
+            for index, objective in enumerate(objectives):
+                next_objective = objectives[index + 1] if index + 1 < len(objectives) else None
+                # When the client goes away the objective is cancelled, its
+                # plan stops after the operation in progress
+                current, prefetch = prefetch, None
+                result = await run_objective_async(
+                    "gemini-1.5-flash", objective, session, current, next_objective
+                )
+                prefetch = result["handoff"]
+                if result["completed"]:
+                    completed += 1
+                yield json.dumps({**objective_result(index, objective, result), "sessionId": session_id}) + "\n"
+                if not result["completed"] and request.stopOnFailure:
+                    skipped = len(objectives) - index - 1
+                    break
+        except Exception as e:
+            logger.error(f"Error in batch execution: {str(e)}")
+            yield json.dumps({"error": str(e), "sessionId": session_id}) + "\n"
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+            if session is None:
+                desktop_lock.release()
+            else:
+                session_pool.release(session)
+    yield json.dumps({
+        "summary": {
+            "objectives": len(request.objectives),
+            "completed": completed,
+            "skipped": skipped,
+            "total": time.perf_counter() - started,
+        },
+        "sessionId": session_id,
+    }) + "\n"
+
 @app.get("/status")
 async def get_status():
     """Get the current status of the automation service"""
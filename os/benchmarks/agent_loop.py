@@ -0,0 +1,220 @@
+"""
+End-to-end latency benchmark for the agent loop.
+
+Drives `operate.operate.main` and the `api_server.py` endpoints against a
+local stub model server that replays recorded Gemini responses, with input
+going to the in-memory recording backend and captures coming from a
+headless Xvfb display. The local planner is turned off so every recorded
+step is replayed. Reports per-stage timings and saves them as JSON so
+runs can be compared across commits.
+
+Run from the `os` directory:
+
+    python -m benchmarks.agent_loop --latency 0.8 --output results.json
+    python -m benchmarks.agent_loop --compare results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from dataclasses import replace
+
+from benchmarks.stub import StubModelServer, load_recordings
+from operate.utils.input_backend import RecordingBackend
+from operate.utils.timing import percentile, timings
+from operate.utils.xvfb import Xvfb
+
+MODEL = "gemini-1.5-flash"
+STAGES = ["capture", "encode", "model", "parse", "execute", "step"]
+DEFAULT_RESPONSES = os.path.join(os.path.dirname(__file__), "responses.json")
+
+
+def run_cli(objectives, repeat, stub):
+    from operate.operate import main
+
+    steps = {}
+    wall_time = {}
+    for objective in objectives:
+        for _ in range(repeat):
+            stub.replayer.reset()
+            model_calls = len(timings.samples("model"))
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(MODEL, terminal_prompt=objective)
+            wall_time.setdefault(objective, []).append(time.perf_counter() - started)
+            steps.setdefault(objective, []).append(
+                len(timings.samples("model")) - model_calls
+            )
+    return steps, wall_time
+
+
+def _post(base_url, path, payload):
+    request = urllib.request.Request(
+        base_url + path,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def run_api(objectives, repeat, stub):
+    import uvicorn
+    from api_server import app
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    steps = {}
+    wall_time = {}
+    try:
+        for objective in objectives:
+            for _ in range(repeat):
+                stub.replayer.reset()
+                started = time.perf_counter()
+                count = 0
+                # Mirror the frontend: generate, execute, repeat until done
+                while count < 10:
+                    generated = _post(base_url, "/generate-actions", {"objective": objective})
+                    count += 1
+                    actions = generated.get("actions") or []
+                    if not actions:
+                        break
+                    _post(base_url, "/automate", {"objective": objective, "actions": actions})
+                    if any(action.get("operation") == "done" for action in actions):
+                        break
+                wall_time.setdefault(objective, []).append(time.perf_counter() - started)
+                steps.setdefault(objective, []).append(count)
+    finally:
+        server.should_exit = True
+        thread.join()
+    return steps, wall_time
+
+
+def summarize(steps, wall_time):
+    result = {"stages": {}}
+    for stage in STAGES:
+        values = timings.samples(stage)
+        if not values:
+            continue
+        result["stages"][stage] = {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+    result["steps_per_objective"] = steps
+    result["objective_wall_time"] = wall_time
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    for target, result in results["targets"].items():
+        print(f"\n[{target}]")
+        print(f"{'stage':<10} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for stage, row in result["stages"].items():
+            print(
+                f"{stage:<10} {row['count']:>6} {row['mean']:>8.3f}s {row['p50']:>8.3f}s "
+                f"{row['p95']:>8.3f}s {row['p99']:>8.3f}s"
+            )
+        for objective, counts in result["steps_per_objective"].items():
+            print(f"steps for '{objective}': {counts}")
+
+
+def print_comparison(baseline, results):
+    print(f"\nCompared to {baseline.get('commit') or 'baseline'}:")
+    for target, result in results["targets"].items():
+        previous = baseline.get("targets", {}).get(target, {}).get("stages", {})
+        for stage, row in result["stages"].items():
+            if stage not in previous:
+                continue
+            for key in ("p50", "p95"):
+                old, new = previous[stage][key], row[key]
+                change = (new - old) / old * 100 if old else 0.0
+                print(f"[{target}] {stage:<8} {key} {old:.3f}s -> {new:.3f}s ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MJAK agent loop.")
+    parser.add_argument("--responses", default=DEFAULT_RESPONSES, help="Recorded model responses (JSON)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform jitter added to the latency")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per objective")
+    parser.add_argument("--targets", default="cli,api", help="Comma separated: cli, api")
+    parser.add_argument("--no-xvfb", action="store_true", help="Use the current DISPLAY instead of Xvfb")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.responses)
+    objectives = list(recordings) if isinstance(recordings, dict) else ["Benchmark objective"]
+
+    stub = StubModelServer(recordings, latency=args.latency, jitter=args.jitter).start()
+    os.environ["GOOGLE_API_ENDPOINT"] = stub.endpoint
+    os.environ.setdefault("GOOGLE_API_KEY", "stub")
+
+    from operate.operate import config, operating_system
+
+    operating_system.backend = RecordingBackend()
+    # Every step of the recorded sessions goes through the model, even the
+    # ones the local planner could handle ("Open the calculator")
+    config.settings = replace(config.settings, local_planner=False)
+
+    xvfb = None
+    if not args.no_xvfb:
+        xvfb = Xvfb().start()
+        os.environ["DISPLAY"] = xvfb.display
+
+    runners = {"cli": run_cli, "api": run_api}
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "settings": {"latency": args.latency, "jitter": args.jitter, "repeat": args.repeat},
+        "targets": {},
+    }
+    try:
+        for target in args.targets.split(","):
+            timings.reset()
+            steps, wall_time = runners[target.strip()](objectives, args.repeat, stub)
+            results["targets"][target] = summarize(steps, wall_time)
+    finally:
+        stub.stop()
+        if xvfb is not None:
+            xvfb.stop()
+
+    print_report(results)
+    if args.compare:
+        with open(args.compare) as file:
+            print_comparison(json.load(file), results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Per-operation overhead of the executor.
+
+Converts a long synthetic plan (keystrokes, typing and clicks, as the model
+or the API would send them) into Actions, compiles it and executes it with
+`operate` on the in-memory recording backend, the same path the agent loop
+and /automate take. Settle waits, key holds and click animations are set to
+zero, everything else (action verification included) follows the settings,
+so what is measured is the executor's own cost per operation.
+
+Run from the `os` directory:
+
+    python -m benchmarks.executor --operations 500
+
+Add `--verify` to measure with action verification on.
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+from dataclasses import replace
+
+from operate.action import parse_actions
+from operate.utils.input_backend import RecordingBackend
+from operate.utils.plan import ExecutionTimeline, compile_plan
+
+
+def synthetic_plan(count):
+    operations = []
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            operations.append({"thought": "select", "operation": "press", "keys": ["ctrl", "a"]})
+        elif kind == 1:
+            operations.append({"thought": "type", "operation": "write", "content": "x"})
+        elif kind == 2:
+            operations.append({"thought": "next", "operation": "hotkey", "keys": ["tab"]})
+        else:
+            operations.append({"thought": "click", "operation": "click", "x": "0.5", "y": "0.5"})
+    operations.append({"thought": "finished", "operation": "done", "summary": "benchmark"})
+    return operations
+
+
+def measure(operations, rounds, verify=None):
+    from PIL import Image
+
+    from operate.operate import config, operate
+    from operate.session import Session
+
+    changes = dict(
+        settle_delay=0.0,
+        key_hold=0.0,
+        click_move_duration=0.0,
+        click_circle_duration=0.0,
+    )
+    if verify is not None:
+        changes["verify_actions"] = verify
+    config.settings = replace(config.settings, **changes)
+    session = Session(backend=RecordingBackend(simulate_durations=False))
+    # A static screen, verified clicks see no change and are retried
+    frame = Image.new("RGB", (1280, 800))
+    session.grab_screen = lambda: frame
+    results = {"parse": [], "compile": [], "execute": []}
+    for _ in range(rounds):
+        started = time.perf_counter()
+        actions = parse_actions(operations)
+        parsed = time.perf_counter()
+        plan = compile_plan(actions, 0.0)
+        compiled = time.perf_counter()
+        # operate compiles the plan itself, as it does in the agent loop
+        with contextlib.redirect_stdout(io.StringIO()):
+            operate(actions, "benchmark", ExecutionTimeline(), session)
+        executed = time.perf_counter()
+        results["parse"].append((parsed - started) / len(operations))
+        results["compile"].append((compiled - parsed) / len(operations))
+        results["execute"].append((executed - compiled) / len(plan))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the executor's per-operation overhead.")
+    parser.add_argument("--operations", type=int, default=500, help="Operations in the plan")
+    parser.add_argument("--rounds", type=int, default=5, help="Runs, the fastest is reported")
+    parser.add_argument(
+        "--verify",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Turn action verification on or off (default: the verify_actions setting)",
+    )
+    args = parser.parse_args()
+
+    results = measure(synthetic_plan(args.operations), args.rounds, args.verify)
+    print(f"{'stage':<10} {'per op':>10}")
+    for stage, values in results.items():
+        print(f"{stage:<10} {min(values) * 1e6:>8.1f}us")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Import-time budget for the operate CLI.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter,
+reports the slowest imports and fails when the cumulative import time of the
+module exceeds the budget, or when one of the heavy subsystems that should
+only load on demand is imported eagerly. Also times `operate --help` end to
+end.
+
+Run from the `os` directory:
+
+    python -m benchmarks.import_time --budget-ms 150
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+# Subsystems that must not be imported just to start the CLI
+HEAVY_MODULES = ["google.generativeai", "pyautogui", "Xlib", "prompt_toolkit", "PIL", "numpy"]
+
+
+def measure_import(module):
+    """
+    Returns {imported module: (self_us, cumulative_us)} for a fresh import.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return imports
+
+
+def measure_help(repeat):
+    """
+    Best wall time of `python -m operate.main --help` over `repeat` runs.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "operate.main", "--help"],
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the operate CLI.")
+    parser.add_argument("--module", default="operate.main", help="Module to import")
+    parser.add_argument("--budget-ms", type=float, default=150, help="Cumulative import time budget")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of `operate --help` to time")
+    args = parser.parse_args()
+
+    imports = measure_import(args.module)
+    total_ms = imports[args.module][1] / 1000
+
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    slowest = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {name}")
+    print(f"\nimport {args.module}: {total_ms:.1f}ms (budget {args.budget_ms:.0f}ms)")
+    print(f"operate --help: {measure_help(args.repeat) * 1000:.0f}ms")
+
+    failed = False
+    eager = [
+        heavy for heavy in HEAVY_MODULES
+        if any(name == heavy or name.startswith(heavy + ".") for name in imports)
+    ]
+    if eager:
+        print(f"[FAILED] heavy modules imported eagerly: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print("[FAILED] import time over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Deterministic offline replay of a recorded trace.
+
+Feeds the model responses of a trace (see operate.utils.trace) back
+through `run_objective` with a local stub model, the recorded frames as
+the screen and input going to the in-memory recording backend. Fails when
+the replayed actions differ from the recorded ones and reports the stage
+timings next to the recorded ones, so real-world sessions double as
+performance regression tests.
+
+Record traces with `MJAK_TRACE_DIR=traces operate`, then run from the `os`
+directory:
+
+    python -m benchmarks.replay traces/20240101-120000-open-the-calculator-1a2b3c4d.mjtrace
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from dataclasses import fields, replace
+
+from operate.config import Settings
+from benchmarks.stub import StubModelServer
+from operate.utils.input_backend import RecordingBackend
+from operate.utils.timing import percentile, timings
+from operate.utils.trace import load_trace
+
+STAGES = ["capture", "encode", "model", "parse", "execute", "step"]
+
+
+class RecordedScreen:
+    """
+    Returns the recorded frames in order, one per capture, then keeps
+    returning the last one.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.captures = 0
+
+    def grab(self):
+        frame = self.frames[min(self.captures, len(self.frames) - 1)]
+        self.captures += 1
+        return frame.copy()
+
+
+class RecordedWindows:
+    """
+    Returns the recorded focused window boxes in order, one per model call.
+    """
+
+    def __init__(self, windows):
+        self.windows = windows
+        self.queries = 0
+
+    def focused_window(self):
+        window = self.windows[self.queries] if self.queries < len(self.windows) else None
+        self.queries += 1
+        return window
+
+
+def replay_settings(recorded):
+    """
+    The recorded settings, minus everything that would make the replay
+    nondeterministic or write to disk.
+    """
+    known = {field.name for field in fields(Settings)}
+    settings = replace(Settings(), **{k: v for k, v in (recorded or {}).items() if k in known})
+    return replace(
+        settings,
+        speculative_prefetch=False,
+        verify_actions=False,
+        trace_dir="",
+        artifact_dir="",
+        model_hedge_percentile=0,
+    )
+
+
+def recorded_stats(trace):
+    latencies = [step["model"]["latency"] for step in trace["steps"] if "model" in step]
+    execute = [
+        sum(entry["actual"] for entry in step["timeline"]["entries"])
+        for step in trace["steps"]
+        if "timeline" in step
+    ]
+    stats = {}
+    for stage, values in (("model", latencies), ("execute", execute)):
+        if values:
+            stats[stage] = {"mean": sum(values) / len(values), "p50": percentile(values, 50)}
+    return stats
+
+
+def replay(trace, latency=None, verbose=False):
+    from operate.operate import config, run_objective
+    from operate.session import Session
+
+    meta = trace["meta"]
+    model_steps = [step for step in trace["steps"] if "model" in step]
+    responses = [step["model"]["response"] for step in model_steps]
+    frames = [
+        trace["frames"][step["model"]["frame"]]
+        for step in model_steps
+        if step["model"]["frame"] is not None
+    ]
+    if latency is None:
+        latencies = [step["model"]["latency"] for step in model_steps]
+        latency = sum(latencies) / len(latencies) if latencies else 0.0
+
+    stub = StubModelServer(responses, latency=latency).start()
+    os.environ["GOOGLE_API_ENDPOINT"] = stub.endpoint
+    config.google_api_key = config.google_api_key or "replay"
+    config.settings = replay_settings(meta.get("settings"))
+
+    backend = RecordingBackend()
+    session = Session(backend=backend)
+    screen = RecordedScreen(frames)
+    session.grab_screen = screen.grab
+    session.focused_window = RecordedWindows([step["model"].get("window") for step in model_steps]).focused_window
+
+    timings.reset()
+    started = time.perf_counter()
+    try:
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            result = run_objective(meta["model"], meta["objective"], session)
+    finally:
+        stub.stop()
+        session.close()
+    return {
+        "result": {"completed": result["completed"], "steps": result["steps"]},
+        "wall_time": time.perf_counter() - started,
+        "operations": [step["operations"] for step in session.history],
+        "events": len(backend.events),
+        "model_requests": stub.requests,
+    }
+
+
+def compare_actions(trace, replayed):
+    """
+    Returns the differences between the recorded and replayed operations.
+    """
+    recorded = [
+        step["actions"]["operations"]
+        for step in trace["steps"]
+        if step.get("actions", {}).get("operations")
+    ]
+    differences = []
+    for index in range(max(len(recorded), len(replayed))):
+        expected = recorded[index] if index < len(recorded) else None
+        actual = replayed[index] if index < len(replayed) else None
+        if expected != actual:
+            differences.append({"step": index, "recorded": expected, "replayed": actual})
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded MJAK trace offline.")
+    parser.add_argument("trace", help="Trace file written with the trace_dir setting")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        help="Simulated model latency in seconds (default: the recorded mean)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show the agent loop output")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace)
+    if trace["meta"] is None:
+        print(f"[FAILED] {args.trace} has no metadata record")
+        return 1
+    print(f"Replaying '{trace['meta']['objective']}' ({len(trace['steps'])} steps, {len(trace['frames'])} frames)")
+
+    replayed = replay(trace, args.latency, args.verbose)
+    differences = compare_actions(trace, replayed["operations"])
+    recorded = recorded_stats(trace)
+
+    print(f"{'stage':<10} {'count':>6} {'mean':>9} {'p50':>9} {'recorded p50':>13}")
+    stages = {}
+    for stage in STAGES:
+        values = timings.samples(stage)
+        if not values:
+            continue
+        stages[stage] = {"count": len(values), "mean": sum(values) / len(values), "p50": percentile(values, 50)}
+        previous = recorded.get(stage, {}).get("p50")
+        previous = f"{previous:>12.3f}s" if previous is not None else f"{'-':>13}"
+        print(
+            f"{stage:<10} {len(values):>6} {stages[stage]['mean']:>8.3f}s "
+            f"{stages[stage]['p50']:>8.3f}s {previous}"
+        )
+    print(f"wall time {replayed['wall_time']:.2f}s, {replayed['events']} input events")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "trace": args.trace,
+                    "objective": trace["meta"]["objective"],
+                    "stages": stages,
+                    "recorded": recorded,
+                    "differences": differences,
+                    **replayed,
+                },
+                file,
+                indent=2,
+                default=str,
+            )
+
+    if differences:
+        for difference in differences:
+            print(f"[FAILED] step {difference['step']}: recorded {difference['recorded']}, replayed {difference['replayed']}")
+        return 1
+    print("[PASSED] replayed actions match the trace")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
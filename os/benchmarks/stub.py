@@ -0,0 +1,161 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ResponseReplayer:
+    """
+    Replays recorded model responses.
+
+    `recordings` is either a list of responses replayed in order for every
+    prompt, or a dict mapping an objective to its own list of responses. The
+    objective is matched against the `Objective: ...` line of the prompt.
+    Once a sequence is exhausted an empty action list is returned, which
+    ends the agent loop.
+    """
+
+    def __init__(self, recordings):
+        if isinstance(recordings, dict):
+            self._sequences = {key: list(value) for key, value in recordings.items()}
+        else:
+            self._sequences = {None: list(recordings)}
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def _match(self, prompt):
+        for objective in self._sequences:
+            if objective is not None and f"Objective: {objective}" in prompt:
+                return objective
+        return None
+
+    def next_response(self, prompt):
+        with self._lock:
+            key = self._match(prompt or "")
+            sequence = self._sequences.get(key, [])
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+        if cursor >= len(sequence):
+            return "[]"
+        response = sequence[cursor]
+        return response if isinstance(response, str) else json.dumps(response)
+
+    def reset(self):
+        with self._lock:
+            self._cursors = {}
+
+
+def load_recordings(path):
+    """
+    Loads recorded responses from a JSON file, see ResponseReplayer.
+    """
+    with open(path) as file:
+        data = json.load(file)
+    if isinstance(data, dict) and "responses" in data:
+        return data["responses"]
+    return data
+
+
+def _delay(latency, jitter):
+    if latency or jitter:
+        time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """
+    In-process stand-in for a `genai.GenerativeModel`, returns replayed
+    responses after a configurable latency.
+    """
+
+    def __init__(self, recordings, latency=0.0, jitter=0.0):
+        self.replayer = ResponseReplayer(recordings)
+        self.latency = latency
+        self.jitter = jitter
+
+    def generate_content(self, contents, **kwargs):
+        prompt = next((part for part in contents if isinstance(part, str)), "")
+        _delay(self.latency, self.jitter)
+        return StubResponse(self.replayer.next_response(prompt))
+
+
+class StubModelServer:
+    """
+    Local HTTP server speaking enough of the Gemini REST API for
+    `generateContent` to work. Point the client at it with
+    GOOGLE_API_ENDPOINT=http://host:port.
+    """
+
+    def __init__(self, recordings, latency=0.0, jitter=0.0, host="127.0.0.1", port=0):
+        self.replayer = ResponseReplayer(recordings)
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if ":generateContent" not in self.path:
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                prompt = "".join(
+                    part.get("text", "")
+                    for content in body.get("contents", [])
+                    for part in content.get("parts", [])
+                )
+                stub.requests += 1
+                _delay(stub.latency, stub.jitter)
+                payload = json.dumps(
+                    {
+                        "candidates": [
+                            {
+                                "content": {
+                                    "parts": [{"text": stub.replayer.next_response(prompt)}],
+                                    "role": "model",
+                                },
+                                "finishReason": "STOP",
+                                "index": 0,
+                            }
+                        ]
+                    }
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mjak-stub-model", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
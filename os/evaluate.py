@@ -5,6 +5,15 @@ import platform
 import base64
 import json
 import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree import ElementTree
 from dotenv import load_dotenv
 import google.generativeai as genai
 from PIL import Image
@@ -26,6 +35,8 @@ Guideline: {guideline}
 """
 
 SCREENSHOT_PATH = os.path.join("screenshots", "screenshot.png")
+CACHE_PATH = "evaluation_cache.json"
+GOLDEN_DIR = "golden"
 
 # Check if on a windows terminal that supports ANSI escape codes
 def supports_ansi():
@@ -65,32 +76,314 @@ def parse_eval_content(content):
         )
         exit(1)
 
-def evaluate_final_screenshot(guideline, gemini_model):
+class LocalJudge:
+    """
+    Scores the final frame against golden reference screenshots of a test
+    case, stored as `<golden_dir>/<objective slug>/*.png`, without calling
+    the model.
+
+    Methods:
+        ssim -- structural similarity against the closest golden screenshot
+        phash -- perceptual hash similarity against the closest golden screenshot
+        template -- every golden image must be found inside the frame (needs opencv)
+
+    A score at or above pass_threshold passes, at or below fail_threshold
+    fails, anything in between is ambiguous and left to the LLM judge.
+    """
+
+    def __init__(self, method="ssim", golden_dir=GOLDEN_DIR, pass_threshold=0.9, fail_threshold=0.5):
+        self.method = method
+        self.golden_dir = golden_dir
+        self.pass_threshold = pass_threshold
+        self.fail_threshold = fail_threshold
+
+    @staticmethod
+    def slug(objective):
+        return re.sub(r"[^a-z0-9]+", "-", objective.lower()).strip("-")
+
+    def golden_paths(self, objective):
+        return sorted(glob.glob(os.path.join(self.golden_dir, self.slug(objective), "*.png")))
+
+    def save_golden(self, objective, img):
+        directory = os.path.join(self.golden_dir, self.slug(objective))
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256(img.tobytes()).hexdigest()[:16]
+        img.save(os.path.join(directory, f"{digest}.png"))
+
+    def score(self, objective, img):
+        """Returns a similarity score in [0, 1], or None when there is nothing to compare against."""
+        paths = self.golden_paths(objective)
+        if not paths:
+            return None
+        goldens = [Image.open(path) for path in paths]
+        if self.method == "template":
+            return min(template_score(img, golden) for golden in goldens)
+        if self.method == "phash":
+            from operate.utils.screenshot import hash_distance, perceptual_hash
+
+            frame_hash = perceptual_hash(img)
+            return max(1 - hash_distance(frame_hash, perceptual_hash(golden)) / 64 for golden in goldens)
+        return max(ssim_score(img, golden) for golden in goldens)
+
+    def judge(self, objective, img):
+        """Returns True or False for a confident local verdict, None when ambiguous."""
+        score = self.score(objective, img)
+        if score is None:
+            return None
+        print(f"[Local judge] {self.method} score {score:.3f}")
+        if score >= self.pass_threshold:
+            return True
+        if score <= self.fail_threshold:
+            return False
+        return None
+
+def ssim_score(img, golden, size=(256, 144)):
+    """Mean structural similarity over 8x8 blocks of the downscaled grayscale images."""
+    import numpy as np
+
+    a = np.asarray(img.convert("L").resize(size), dtype=np.float64)
+    b = np.asarray(golden.convert("L").resize(size), dtype=np.float64)
+    height, width = a.shape[0] // 8 * 8, a.shape[1] // 8 * 8
+    a = a[:height, :width].reshape(height // 8, 8, width // 8, 8)
+    b = b[:height, :width].reshape(height // 8, 8, width // 8, 8)
+    mean_a, mean_b = a.mean(axis=(1, 3)), b.mean(axis=(1, 3))
+    var_a, var_b = a.var(axis=(1, 3)), b.var(axis=(1, 3))
+    covariance = (
+        (a - mean_a[:, None, :, None]) * (b - mean_b[:, None, :, None])
+    ).mean(axis=(1, 3))
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    ssim = ((2 * mean_a * mean_b + c1) * (2 * covariance + c2)) / (
+        (mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2)
+    )
+    return float(ssim.mean())
+
+def template_score(img, template):
+    """Best normalized cross-correlation of the template anywhere in the image."""
+    import cv2
+    import numpy as np
+
+    haystack = cv2.cvtColor(np.asarray(img.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    needle = cv2.cvtColor(np.asarray(template.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    if needle.shape[0] > haystack.shape[0] or needle.shape[1] > haystack.shape[1]:
+        return 0.0
+    return float(cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED).max())
+
+# Set from the command line, see get_test_args
+local_judge = None
+golden_save_dir = None
+
+def evaluate_image(guideline, gemini_model, img, objective=None):
+    """Return True or False if the image meets the given guideline, locally when the golden screenshots are conclusive, otherwise using Gemini."""
+    if local_judge is not None and objective is not None:
+        verdict = local_judge.judge(objective, img)
+        if verdict is not None:
+            return verdict
+    prompt = format_evaluation_prompt(guideline)
+    response = gemini_model.generate_content([prompt, img])
+    eval_content = response.text.lstrip()
+    passed = parse_eval_content(eval_content)
+    if passed and golden_save_dir and objective is not None:
+        LocalJudge(golden_dir=golden_save_dir).save_golden(objective, img)
+    return passed
+
+def evaluate_final_screenshot(guideline, gemini_model, screenshot_path=SCREENSHOT_PATH, objective=None):
     """Load the final screenshot and return True or False if it meets the given guideline using Gemini."""
-    with open(SCREENSHOT_PATH, "rb") as img_file:
+    with open(screenshot_path, "rb") as img_file:
         img = Image.open(img_file)
-        prompt = format_evaluation_prompt(guideline)
-        response = gemini_model.generate_content([prompt, img])
-        eval_content = response.text.lstrip()
-        return parse_eval_content(eval_content)
+        return evaluate_image(guideline, gemini_model, img, objective)
+
+def operate_command(objective, model):
+    return ["operate", "-m", model, "--prompt", f'"{objective}"']
 
 def run_test_case(objective, guideline, model, gemini_model):
     """Returns True if the result of the test with the given prompt meets the given guideline for the given model."""
     # Run `operate` with the model to evaluate and the test case prompt
     subprocess.run(
-        ["operate", "-m", model, "--prompt", f'"{objective}"'],
+        operate_command(objective, model),
         stdout=subprocess.DEVNULL,
     )
 
     try:
-        result = evaluate_final_screenshot(guideline, gemini_model)
+        result = evaluate_final_screenshot(guideline, gemini_model, objective=objective)
     except OSError:
         print("[Error] Couldn't open the screenshot for evaluation")
         return False
 
     return result
 
-def get_test_model():
+class JudgementCache:
+    """
+    Remembers the judge's verdict per (objective, guideline, final frame) so
+    identical final screens are not sent to the judge again.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        try:
+            with open(path) as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def key(objective, guideline, img):
+        frame_hash = hashlib.sha256(img.tobytes()).hexdigest()
+        return hashlib.sha256(
+            json.dumps([objective, guideline, img.size, frame_hash]).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, passed):
+        self.entries[key] = passed
+        with open(self.path, "w") as file:
+            json.dump(self.entries, file)
+
+def run_test_case_in_process(objective, guideline, model, gemini_model, cache):
+    """
+    Runs the agent loop in this process and judges the final frame from
+    memory, reusing the warm model client and skipping identical judgements.
+    """
+    from operate.operate import run_objective
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_objective(model, objective)
+    frame = result["frame"]
+    if frame is None:
+        print("[Error] No final frame to evaluate")
+        return False
+
+    if cache is None:
+        return bool(evaluate_image(guideline, gemini_model, frame, objective))
+    key = cache.key(objective, guideline, frame)
+    cached = cache.get(key)
+    if cached is not None:
+        print("[Cached judgement]")
+        return cached
+    passed = bool(evaluate_image(guideline, gemini_model, frame, objective))
+    cache.put(key, passed)
+    return passed
+
+# Judge model of the current worker process, see init_worker
+worker_gemini_model = None
+
+def init_worker(google_api_key, judge=None, save_dir=None):
+    global worker_gemini_model, local_judge, golden_save_dir
+    local_judge = judge
+    golden_save_dir = save_dir
+    genai.configure(api_key=google_api_key, transport="rest")
+    worker_gemini_model = genai.GenerativeModel("gemini-1.5-flash")
+
+def run_isolated_test_case(objective, guideline, model, timeout):
+    """
+    Runs a test case in its own Xvfb display and working directory so cases
+    can run in parallel without sharing the screen or `screenshots/`.
+    Returns a result dict for the report.
+    """
+    from operate.utils.xvfb import Xvfb
+
+    result = {
+        "objective": objective,
+        "guideline": guideline,
+        "passed": False,
+        "timed_out": False,
+        "error": None,
+    }
+    started = time.time()
+    with tempfile.TemporaryDirectory(prefix="mjak-eval-") as workdir, Xvfb() as xvfb:
+        env = dict(os.environ, DISPLAY=xvfb.display)
+        try:
+            subprocess.run(
+                operate_command(objective, model),
+                cwd=workdir,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            result["timed_out"] = True
+            result["error"] = f"Timed out after {timeout}s"
+        result["operate_time"] = time.time() - started
+
+        if not result["timed_out"]:
+            try:
+                screenshot_path = os.path.join(workdir, SCREENSHOT_PATH)
+                result["passed"] = bool(
+                    evaluate_final_screenshot(guideline, worker_gemini_model, screenshot_path, objective)
+                )
+            except OSError:
+                result["error"] = "Couldn't open the screenshot for evaluation"
+            except SystemExit:
+                result["error"] = "The model gave a bad evaluation response"
+    result["wall_time"] = time.time() - started
+    return result
+
+def run_parallel(test_cases, model, google_api_key, workers, timeout):
+    """Schedules the test cases over a process pool and returns their results as they finish."""
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(google_api_key, local_judge, golden_save_dir),
+    ) as pool:
+        futures = {
+            pool.submit(run_isolated_test_case, objective, guideline, model, timeout): objective
+            for objective, guideline in test_cases.items()
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                objective = futures[future]
+                result = {
+                    "objective": objective,
+                    "guideline": test_cases[objective],
+                    "passed": False,
+                    "timed_out": False,
+                    "error": str(e),
+                    "wall_time": 0.0,
+                }
+            status = f"{ANSI_GREEN}[PASSED]" if result["passed"] else f"{ANSI_RED}[FAILED]"
+            print(f"{status}{ANSI_RESET} '{result['objective']}' ({result['wall_time']:.1f}s)")
+            results.append(result)
+    return results
+
+def write_json_report(results, model, wall_time, path):
+    report = {
+        "model": model,
+        "wall_time": wall_time,
+        "passed": sum(1 for result in results if result["passed"]),
+        "failed": sum(1 for result in results if not result["passed"]),
+        "cases": results,
+    }
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+def write_junit_report(results, model, wall_time, path):
+    suite = ElementTree.Element(
+        "testsuite",
+        name=f"mjak-evaluation-{model}",
+        tests=str(len(results)),
+        failures=str(sum(1 for result in results if not result["passed"] and not result["error"])),
+        errors=str(sum(1 for result in results if result["error"])),
+        time=f"{wall_time:.3f}",
+    )
+    for result in results:
+        case = ElementTree.SubElement(
+            suite,
+            "testcase",
+            classname="evaluate",
+            name=result["objective"],
+            time=f"{result['wall_time']:.3f}",
+        )
+        if result["error"]:
+            ElementTree.SubElement(case, "error", message=result["error"])
+        elif not result["passed"]:
+            ElementTree.SubElement(case, "failure", message=result["guideline"])
+    ElementTree.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
+
+def get_test_args():
     parser = argparse.ArgumentParser(
         description="Run the MJAK with a specified model."
     )
@@ -101,7 +394,53 @@ def get_test_model():
         required=False,
         default="gemini-1.5-flash",
     )
-    return parser.parse_args().model
+    parser.add_argument(
+        "--parallel",
+        help="Run this many test cases at once, each in its own Xvfb display and working directory.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--timeout",
+        help="Seconds before a test case is stopped and failed (parallel mode).",
+        type=float,
+        default=300,
+    )
+    parser.add_argument(
+        "--in-process",
+        help="Run the agent loop in this process instead of spawning `operate` per test case.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Always ask the judge, even for a final frame that was judged before (in-process mode).",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--local-judge",
+        help="Judge the final frame locally against golden screenshots first, the LLM judge is only used when the score is ambiguous.",
+        choices=["ssim", "phash", "template"],
+    )
+    parser.add_argument(
+        "--golden-dir",
+        help="Directory holding golden screenshots, one sub-directory per test case.",
+        default=GOLDEN_DIR,
+    )
+    parser.add_argument("--pass-threshold", help="Local score at or above which a case passes.", type=float, default=0.9)
+    parser.add_argument("--fail-threshold", help="Local score at or below which a case fails.", type=float, default=0.5)
+    parser.add_argument(
+        "--save-golden",
+        help="Store the final frame of every case the LLM judge passes as a golden screenshot.",
+        action="store_true",
+    )
+    parser.add_argument("--report", help="Write a JSON report to this path.")
+    parser.add_argument("--junit", help="Write a JUnit XML report to this path.")
+    args = parser.parse_args()
+    if args.parallel > 1 and (args.in_process or args.no_cache):
+        # Parallel cases run as `operate` subprocesses on their own displays,
+        # there is no agent loop or judgement cache in this process to share
+        parser.error("--in-process and --no-cache cannot be combined with --parallel")
+    return args
 
 def main():
     load_dotenv()
@@ -109,26 +448,66 @@ def main():
     if not google_api_key:
         print("[Error] GOOGLE_API_KEY not found in environment or .env file.")
         sys.exit(1)
-    genai.configure(api_key=google_api_key, transport="rest")
-    gemini_model = genai.GenerativeModel("gemini-1.5-flash")
+    global local_judge, golden_save_dir
+    args = get_test_args()
+    model = args.model
+    if args.local_judge:
+        local_judge = LocalJudge(
+            args.local_judge, args.golden_dir, args.pass_threshold, args.fail_threshold
+        )
+    if args.save_golden:
+        golden_save_dir = args.golden_dir
 
-    model = get_test_model()
+    cache = None
+    if args.in_process:
+        from operate.config import Config
+
+        # Share one warm client between the agent and the judge
+        gemini_model = Config().get_google_model()
+        if not args.no_cache:
+            cache = JudgementCache()
+    else:
+        genai.configure(api_key=google_api_key, transport="rest")
+        gemini_model = genai.GenerativeModel("gemini-1.5-flash")
 
     print(f"{ANSI_BLUE}[EVALUATING MODEL `{model}`]{ANSI_RESET}")
     print(f"{ANSI_BRIGHT_MAGENTA}[STARTING EVALUATION]{ANSI_RESET}")
 
-    passed = 0
-    failed = 0
-    for objective, guideline in TEST_CASES.items():
-        print(f"{ANSI_BLUE}[EVALUATING]{ANSI_RESET} '{objective}'")
-
-        result = run_test_case(objective, guideline, model, gemini_model)
-        if result:
-            print(f"{ANSI_GREEN}[PASSED]{ANSI_RESET} '{objective}'")
-            passed += 1
-        else:
-            print(f"{ANSI_RED}[FAILED]{ANSI_RESET} '{objective}'")
-            failed += 1
+    started = time.time()
+    if args.parallel > 1:
+        results = run_parallel(TEST_CASES, model, google_api_key, args.parallel, args.timeout)
+    else:
+        results = []
+        for objective, guideline in TEST_CASES.items():
+            print(f"{ANSI_BLUE}[EVALUATING]{ANSI_RESET} '{objective}'")
+
+            case_started = time.time()
+            if args.in_process:
+                result = run_test_case_in_process(objective, guideline, model, gemini_model, cache)
+            else:
+                result = run_test_case(objective, guideline, model, gemini_model)
+            if result:
+                print(f"{ANSI_GREEN}[PASSED]{ANSI_RESET} '{objective}'")
+            else:
+                print(f"{ANSI_RED}[FAILED]{ANSI_RESET} '{objective}'")
+            results.append(
+                {
+                    "objective": objective,
+                    "guideline": guideline,
+                    "passed": bool(result),
+                    "timed_out": False,
+                    "error": None,
+                    "wall_time": time.time() - case_started,
+                }
+            )
+    wall_time = time.time() - started
+
+    passed = sum(1 for result in results if result["passed"])
+    failed = len(results) - passed
+    if args.report:
+        write_json_report(results, model, wall_time, args.report)
+    if args.junit:
+        write_junit_report(results, model, wall_time, args.junit)
 
     print(
         f"{ANSI_BRIGHT_MAGENTA}[EVALUATION COMPLETE]{ANSI_RESET} {passed} test{'' if passed == 1 else 's'} passed, {failed} test{'' if failed == 1 else 's'} failed"
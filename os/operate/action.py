@@ -0,0 +1,173 @@
+import enum
+
+from operate.exceptions import InvalidActionException
+from operate.utils.geometry import region_to_screen
+from operate.utils.label import label_position, normalize_label
+
+
+class Op(enum.Enum):
+    CLICK = "click"
+    WRITE = "write"
+    PRESS = "press"
+    HOTKEY = "hotkey"
+    WAIT = "wait"
+    DONE = "done"
+
+
+def _fraction(value, name):
+    if isinstance(value, str):
+        value = value.strip()
+        if value.endswith("%"):
+            return _fraction(value[:-1], name) / 100
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise InvalidActionException(f"click needs a numeric {name}, got {value!r}")
+
+
+class Action:
+    """
+    One validated operation of a plan. The model's JSON and API requests
+    are converted once with `from_dict`, the executor only reads fields.
+
+    Attributes:
+        op -- the Op to execute
+        thought -- the reasoning shown when the action runs
+        x, y -- click target as fractions of the screen (click)
+        label -- the set-of-marks label ("~3") the click target came from
+        keys -- tuple of key names pressed together (press, hotkey)
+        content -- text to type (write)
+        seconds -- time to wait (wait)
+        summary -- what was achieved (done)
+    """
+
+    __slots__ = ("op", "thought", "x", "y", "label", "keys", "content", "seconds", "summary")
+
+    def __init__(
+        self, op, thought="", x=None, y=None, keys=(), content="", seconds=0.0, summary="", label=None
+    ):
+        self.op = op
+        self.thought = thought
+        self.x = x
+        self.y = y
+        self.label = label
+        self.keys = keys
+        self.content = content
+        self.seconds = seconds
+        self.summary = summary
+
+    @classmethod
+    def from_dict(cls, data, labels=None, region=None):
+        """
+        Builds an Action from a model or API operation such as
+        {"operation": "click", "x": "0.10", "y": "0.13"}. Raises
+        InvalidActionException when it cannot be executed.
+
+        A labeled click ({"operation": "click", "label": "~3"}) is resolved
+        to the center of the label's box with `labels`, the label map of
+        the frame the model saw (see label_image). When the model saw a
+        cropped `region` of the screen (see window_region) its coordinates
+        are mapped back to the screen.
+        """
+        if not isinstance(data, dict):
+            raise InvalidActionException(f"an operation must be an object, got {data!r}")
+        name = str(data.get("operation") or "").strip().lower()
+        try:
+            op = Op(name)
+        except ValueError:
+            raise InvalidActionException(f"unknown operation {name!r}")
+        action = cls(op, str(data.get("thought") or ""))
+        if op is Op.CLICK:
+            label = data.get("label")
+            if label is not None:
+                action.label = normalize_label(label)
+            if action.label is not None and data.get("x") is None and data.get("y") is None:
+                # Coordinates win when both are given, they were resolved
+                # against the frame the model saw
+                position = label_position(action.label, labels) if labels else None
+                if position is None:
+                    raise InvalidActionException(f"unknown label {action.label!r}")
+                action.x, action.y = position
+            else:
+                action.x = _fraction(data.get("x"), "x")
+                action.y = _fraction(data.get("y"), "y")
+                if region is not None:
+                    action.x, action.y = region_to_screen(action.x, action.y, region)
+        elif op is Op.PRESS or op is Op.HOTKEY:
+            keys = data.get("keys") or ()
+            if isinstance(keys, str):
+                keys = [keys]
+            action.keys = tuple(str(key) for key in keys)
+        elif op is Op.WRITE:
+            action.content = str(data.get("content") or "")
+        elif op is Op.WAIT:
+            try:
+                action.seconds = float(data.get("seconds") or 0)
+            except (TypeError, ValueError):
+                raise InvalidActionException(f"wait needs numeric seconds, got {data.get('seconds')!r}")
+        else:
+            action.summary = str(data.get("summary") or "")
+        return action
+
+    def to_dict(self):
+        """
+        The operation in the JSON shape the model and the API use.
+        """
+        data = {"thought": self.thought, "operation": self.op.value}
+        op = self.op
+        if op is Op.CLICK:
+            data["x"] = f"{self.x:g}"
+            data["y"] = f"{self.y:g}"
+            if self.label is not None:
+                data["label"] = self.label
+        elif op is Op.PRESS or op is Op.HOTKEY:
+            data["keys"] = list(self.keys)
+        elif op is Op.WRITE:
+            data["content"] = self.content
+        elif op is Op.WAIT:
+            data["seconds"] = self.seconds
+        else:
+            data["summary"] = self.summary
+        return data
+
+    def replace(self, **changes):
+        action = Action(
+            self.op,
+            self.thought,
+            self.x,
+            self.y,
+            self.keys,
+            self.content,
+            self.seconds,
+            self.summary,
+            self.label,
+        )
+        for name, value in changes.items():
+            setattr(action, name, value)
+        return action
+
+    def __eq__(self, other):
+        if not isinstance(other, Action):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Action({self.to_dict()!r})"
+
+
+def parse_actions(operations, labels=None, region=None):
+    """
+    Converts the operations of a model response or API request into
+    Actions, a single operation object is accepted as a one-item list.
+    `labels` resolves labeled clicks and `region` maps coordinates from a
+    cropped frame, see Action.from_dict.
+    """
+    if isinstance(operations, dict):
+        operations = [operations]
+    if not isinstance(operations, list):
+        raise InvalidActionException(f"expected a list of operations, got {type(operations).__name__}")
+    return [Action.from_dict(operation, labels, region) for operation in operations]
+
+
+def to_dicts(actions):
+    return [action.to_dict() for action in actions]
@@ -1,11 +1,118 @@
+import json
 import os
 import sys
+import threading
+from dataclasses import dataclass, fields, replace
 from dotenv import load_dotenv
-import google.generativeai as genai
-from prompt_toolkit.shortcuts import input_dialog
+
+SETTINGS_FILE = "mjak_settings.json"
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Latency knobs of the agent loop and executor.
+
+    Every field can be overridden from the JSON settings file (MJAK_SETTINGS_FILE,
+    default mjak_settings.json) or an environment variable named after the
+    field, e.g. MJAK_MAX_ITERATIONS=5. Environment variables win.
+    """
+
+    # Agent loop, the steps and wall-clock seconds an objective may take
+    # (0 for no deadline)
+    max_iterations: int = 10
+    objective_timeout: float = 300.0
+    pre_capture_delay: float = 1.0
+    post_capture_delay: float = 1.0
+    settle_delay: float = 1.0
+    # Start the next capture and model call while the last action of a plan
+    # runs, dropped when more than this fraction of the pixels changed since
+    # (typing a few characters changes about 0.0007, a blinking caret 0.00005)
+    speculative_prefetch: bool = True
+    prefetch_diff_threshold: float = 0.0001
+    # Capture region sent to the model: "screen", or "window" for the focused
+    # window (Linux) grown by window_margin pixels
+    capture_region: str = "screen"
+    window_margin: int = 16
+    # Label the clickable elements of every screenshot (set-of-marks, needs
+    # ultralytics) so the model answers clicks with a label ID
+    labeled_mode: bool = False
+    # Plan trivial objectives ("open notepad") without calling the model
+    local_planner: bool = True
+    # Check every click for a visible change by diffing frames, around the
+    # target (radius in screen fractions) and globally, and retry clicks
+    # that changed nothing slightly nudged. Off by default, it adds
+    # verify_delay and two captures to every click
+    verify_actions: bool = False
+    verify_delay: float = 0.3
+    verify_retries: int = 1
+    verify_radius: float = 0.05
+    verify_local_threshold: float = 0.02
+    verify_global_threshold: float = 0.002
+    # Directory to write a trace of every objective to, empty disables
+    trace_dir: str = ""
+    # Content-addressed store for labeled and OCR debug images, capped in
+    # size with least recently used eviction, empty disables
+    artifact_dir: str = "artifacts"
+    artifact_max_mb: float = 256
+    # Executor
+    key_hold: float = 0.1
+    click_move_duration: float = 0.2
+    click_circle_radius: int = 50
+    click_circle_duration: float = 0.5
+    # Image sent to the model, max_width 0 keeps the captured size
+    image_format: str = "PNG"
+    image_quality: int = 85
+    image_max_width: int = 0
+    # Timeouts in seconds
+    capture_timeout: float = 5.0
+    model_timeout: float = 60.0
+    # Executing one plan, 0 for no limit
+    execute_timeout: float = 120.0
+    # Model call retries and hedging, a hedge percentile of 0 disables hedging
+    model_max_retries: int = 2
+    model_backoff_base: float = 0.5
+    model_backoff_max: float = 8.0
+    model_hedge_percentile: float = 95
+    model_hedge_min_samples: int = 10
+    # Upstream quota, calls per second (0 is unlimited) with bursts, and how
+    # many calls may run or wait before new ones are shed
+    model_rate_limit: float = 0.0
+    model_rate_burst: int = 1
+    model_max_concurrency: int = 4
+    model_max_queue: int = 32
+    model_max_queue_wait: float = 30.0
+
+
+def _coerce(value, field_type):
+    if field_type is bool:
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+    return field_type(value)
+
+
+def load_settings(path=None):
+    """
+    Builds Settings from the defaults, the settings file and the environment.
+    """
+    path = path or os.getenv("MJAK_SETTINGS_FILE", SETTINGS_FILE)
+    overrides = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            overrides.update(json.load(file))
+    for field in fields(Settings):
+        env_value = os.getenv(f"MJAK_{field.name.upper()}")
+        if env_value is not None:
+            overrides[field.name] = env_value
+    values = {}
+    for field in fields(Settings):
+        if field.name in overrides:
+            values[field.name] = _coerce(overrides[field.name], field.type)
+    return replace(Settings(), **values)
+
 
 class Config:
     _instance = None
+    _initialized = False
 
     def __new__(cls):
         if cls._instance is None:
@@ -13,16 +120,94 @@ class Config:
         return cls._instance
 
     def __init__(self):
+        # Config() is called from several modules, only the first call loads
+        if self._initialized:
+            return
+        self._initialized = True
         load_dotenv()
         self.verbose = False
         self.google_api_key = None
+        self.settings_path = os.getenv("MJAK_SETTINGS_FILE", SETTINGS_FILE)
+        self.settings = load_settings(self.settings_path)
+        self._google_model = None
+        self._watcher = None
+
+    def reload_settings(self):
+        # Settings are immutable, readers always see a consistent snapshot
+        self.settings = load_settings(self.settings_path)
+        if self.verbose:
+            print("[Config] settings reloaded", self.settings)
+
+    def watch_settings(self, interval=1.0):
+        """
+        Reloads the settings whenever the settings file changes, so a long
+        running server can be tuned without a restart.
+        """
+        if self._watcher is not None:
+            return
+
+        def mtime():
+            try:
+                return os.stat(self.settings_path).st_mtime
+            except OSError:
+                return None
+
+        def watch():
+            last = mtime()
+            while not stop.wait(interval):
+                current = mtime()
+                if current != last:
+                    last = current
+                    try:
+                        self.reload_settings()
+                    except Exception as e:
+                        # Any bad file (a list, a null field) keeps the
+                        # previous settings and the watcher running
+                        print("[Config][watch_settings] error:", e)
+
+        stop = threading.Event()
+        thread = threading.Thread(target=watch, name="mjak-settings-watch", daemon=True)
+        self._watcher = (thread, stop)
+        thread.start()
+
+    def stop_watching_settings(self):
+        if self._watcher is not None:
+            thread, stop = self._watcher
+            stop.set()
+            thread.join()
+            self._watcher = None
+
+    def get_google_model(self):
+        """
+        Returns a configured Gemini model, built once and reused as long as
+        the API key and endpoint stay the same.
+        """
+        key = (
+            self.google_api_key or os.getenv("GOOGLE_API_KEY"),
+            os.getenv("GOOGLE_API_ENDPOINT"),
+        )
+        if self._google_model is None or self._google_model[0] != key:
+            self._google_model = (key, self.initialize_google())
+        return self._google_model[1]
 
     def initialize_google(self):
+        import google.generativeai as genai
+
         if self.google_api_key:
             api_key = self.google_api_key
         else:
             api_key = os.getenv("GOOGLE_API_KEY")
-        genai.configure(api_key=api_key, transport="rest")
+        # GOOGLE_API_ENDPOINT points the client at another server, e.g. the
+        # stub model used by the benchmarks
+        api_endpoint = os.getenv("GOOGLE_API_ENDPOINT")
+        if api_endpoint:
+            genai.configure(
+                api_key=api_key,
+                transport="rest",
+                client_options={"api_endpoint": api_endpoint},
+            )
+        else:
+            genai.configure(api_key=api_key, transport="rest")
         model = genai.GenerativeModel("gemini-1.5-flash")
         return model
 
@@ -35,6 +220,8 @@ class Config:
             self.prompt_and_save_api_key(key_name, key_description)
 
     def prompt_and_save_api_key(self, key_name, key_description):
+        from prompt_toolkit.shortcuts import input_dialog
+
         key_value = input_dialog(
             title="API Key Required", text=f"Please enter your {key_description}:"
         ).run()
@@ -12,4 +12,78 @@ class ModelNotRecognizedException(Exception):
         super().__init__(self.message)
 
     def __str__(self):
-        return f"{self.message} : {self.model} "
\ No newline at end of file
+        return f"{self.message} : {self.model} "
+
+
+class ModelCallException(Exception):
+    """Exception raised when a model call fails for good, after the
+    retries and within the deadline allowed for it.
+
+    Attributes:
+        message -- explanation of the error
+    """
+
+    def __init__(self, message="Model call failed"):
+        self.message = message
+        super().__init__(self.message)
+
+
+
+class ModelOverloadedException(ModelCallException):
+    """Exception raised when a model call is shed because too many calls
+    are already waiting for the rate limit or a free slot.
+
+    Attributes:
+        message -- explanation of the error
+        retry_after -- seconds after which a retry is likely to be admitted
+    """
+
+    def __init__(self, message="Too many model calls in flight", retry_after=1):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+
+class SessionLimitException(Exception):
+    """Exception raised when no session is free and no new one may be
+    started.
+
+    Attributes:
+        message -- explanation of the error
+    """
+
+    def __init__(self, message="No session available"):
+        self.message = message
+        super().__init__(self.message)
+
+
+
+class InvalidActionException(Exception):
+    """Exception raised when an operation from the model or an API request
+    cannot be converted into an executable Action.
+
+    Attributes:
+        message -- explanation of the error
+    """
+
+    def __init__(self, message="Invalid action"):
+        self.message = message
+        super().__init__(self.message)
+
+
+
+class StageTimeoutException(Exception):
+    """Exception raised when a stage of the agent loop (capture, model,
+    execute) does not finish within its timeout or the objective's
+    deadline.
+
+    Attributes:
+        stage -- the stage that timed out
+        timeout -- seconds the stage was given
+    """
+
+    def __init__(self, stage, timeout):
+        self.stage = stage
+        self.timeout = timeout
+        self.message = f"{stage} did not finish within {timeout:.1f}s"
+        super().__init__(self.message)
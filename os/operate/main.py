@@ -1,6 +1,7 @@
 import argparse
 from operate.utils.style import ANSI_BRIGHT_MAGENTA
-from operate.operate import main
+from operate.utils.input_backend import INPUT_BACKENDS, create_input_backend
+from operate.utils.timing import format_summary, timings
 
 def main_entry():
     parser = argparse.ArgumentParser(description="Run the MJAK with Gemini 1.5 Flash (Google).")
@@ -13,10 +14,35 @@ def main_entry():
     )
     parser.add_argument("--verbose", help="Run operate in verbose mode", action="store_true")
     parser.add_argument("--prompt", help="Directly input the objective prompt", type=str, required=False)
+    parser.add_argument(
+        "--capture-fps",
+        help="Capture the screen in the background at this rate (0 disables)",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--input-backend",
+        help="Input backend used to execute actions: pyautogui (default), xtest or recording",
+        choices=sorted(INPUT_BACKENDS),
+        required=False,
+    )
+    parser.add_argument(
+        "--timings",
+        help="Print a summary of the time spent in each stage at exit",
+        action="store_true",
+    )
     # Removed --voice, as voice mode is not supported
 
+    args = parser.parse_args()
+    # Imported after parsing so `operate --help` does not pay for them
+    from operate.operate import main, operating_system
+    from operate.utils.frame_buffer import start_frame_buffer
+
     try:
-        args = parser.parse_args()
+        if args.input_backend:
+            operating_system.backend = create_input_backend(args.input_backend)
+        if args.capture_fps > 0:
+            start_frame_buffer(fps=args.capture_fps)
         main(
             args.model,
             terminal_prompt=args.prompt,
@@ -24,6 +50,13 @@ def main_entry():
         )
     except KeyboardInterrupt:
         print(f"\n{ANSI_BRIGHT_MAGENTA}Exiting...")
+    finally:
+        from operate.utils.artifacts import close_artifact_store
+
+        # Writes still queued on the store's daemon thread would be lost
+        close_artifact_store()
+        if args.timings and timings.names():
+            print(format_summary(timings.summary()))
 
 if __name__ == "__main__":
     main_entry()
\ No newline at end of file
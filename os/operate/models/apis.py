@@ -1,16 +1,124 @@
+import asyncio
 import os
 import time
 import traceback
 import json
-from PIL import Image
 
 from operate.config import Config
 from operate.models.prompts import get_system_prompt
-from operate.utils.screenshot import capture_screen_with_cursor
+from operate.utils.screenshot import (
+    capture_screen_with_cursor,
+    encode_image,
+    focused_window_box,
+    grab_screen,
+)
+from operate.utils.frame_buffer import get_frame_buffer
+from operate.utils.geometry import screen_geometry, window_region
+from operate.utils.timing import span
+from operate.utils.metrics import MODEL_ERRORS, PARSE_FAILURES
+from operate.models.resilience import ResilientCaller
+from operate.models.limiter import get_governor
+from operate.exceptions import (
+    InvalidActionException,
+    ModelCallException,
+    ModelNotRecognizedException,
+    ModelOverloadedException,
+)
+from operate.action import parse_actions
+from operate.models.vision import get_yolo_model
+from operate.utils.label import label_image
 from operate.utils.style import ANSI_BRIGHT_MAGENTA, ANSI_GREEN, ANSI_RED, ANSI_RESET
 
 config = Config()
 
+# The screenshot most recently sent to the model
+last_screenshot = None
+# The last prompt sent to the model with its raw response and latency
+last_exchange = None
+# Label map of the last screenshot labeled for the model
+last_labels = None
+
+
+def get_last_screenshot():
+    """
+    Returns the last screenshot sent to the model as a PIL image, or None.
+    """
+    return last_screenshot
+
+
+def get_last_labels():
+    """
+    Returns {"coordinates", "size"} of the last labeled screenshot, or None.
+    """
+    return last_labels
+
+
+def get_last_exchange():
+    """
+    Returns {"prompt", "response", "latency"} of the last model call, or None.
+    """
+    return last_exchange
+
+
+def remember(session, state, **values):
+    """
+    Stores the last screenshot, exchange or labels of a model call in
+    `state` when given (a speculative call, see SpeculativeStep), otherwise
+    on the session or in the module globals read by get_last_*().
+    """
+    for name, value in values.items():
+        if state is not None:
+            state[name] = value
+        elif session is not None:
+            setattr(session, f"last_{name}", value)
+        else:
+            globals()[f"last_{name}"] = value
+
+
+_model_caller = None
+
+
+def get_model_caller():
+    """
+    Returns the shared ResilientCaller, kept in sync with the settings so a
+    reload takes effect on the next call.
+    """
+    global _model_caller
+    if _model_caller is None:
+        _model_caller = ResilientCaller()
+    settings = config.settings
+    _model_caller.deadline = settings.model_timeout
+    _model_caller.max_retries = settings.model_max_retries
+    _model_caller.backoff_base = settings.model_backoff_base
+    _model_caller.backoff_max = settings.model_backoff_max
+    _model_caller.hedge_percentile = settings.model_hedge_percentile
+    _model_caller.hedge_min_samples = settings.model_hedge_min_samples
+    return _model_caller
+
+def capture_frame(session=None, after=None):
+    """
+    Returns the current screen as a PIL image held in memory. When the
+    background capture is running its first frame taken after `after`
+    (default: within the last capture interval) is used.
+    """
+    frame_buffer = session.frame_buffer if session else get_frame_buffer()
+    if frame_buffer:
+        if after is None:
+            after = time.time() - frame_buffer.interval
+        frame = frame_buffer.wait_for_frame(after, config.settings.capture_timeout)
+        if frame is not None:
+            return _observe_capture(session, frame.image)
+    if session is not None:
+        return _observe_capture(session, session.grab_screen())
+    return _observe_capture(session, grab_screen())
+
+
+def _observe_capture(session, image):
+    # A frame of a new size means the display changed, see ScreenGeometry
+    if image is not None:
+        screen_geometry(session.display if session is not None else None).observe_capture(image.size)
+    return image
+
 def extract_json_from_code_block(content):
     """
     Strips Markdown code block and language tag from model output.
@@ -29,31 +137,165 @@ def extract_json_from_code_block(content):
             content = content[:content.index("```")]
     return content.strip()
 
-async def get_next_action(model, messages, objective, session_id):
+def get_model_call(model):
+    """
+    Returns the function asking `model` for the next operations, called as
+    call(messages, objective, session, screenshot).
+    """
+    if model == "gemini-1.5-flash":
+        return call_gemini_flash
+    raise ModelNotRecognizedException(model)
+
+async def get_next_action(model, messages, objective, session_id, session=None, screenshot=None):
+    """
+    Asks the model for the next operations. With a `session` the screen is
+    captured from the session's display instead of the current desktop,
+    a `screenshot` already captured is sent as is.
+    """
     if config.verbose:
         print("[MJAK][get_next_action] model", model)
-    if model == "gemini-1.5-flash":
-        return call_gemini_flash(messages, objective)
-    raise Exception(f"Model not recognized: {model}")
+    call = get_model_call(model)
+    # Run in a worker thread so concurrent API requests can queue for
+    # the model instead of blocking the event loop
+    return await asyncio.to_thread(call, messages, objective, session, screenshot)
+
+def capture_for_model(session=None):
+    """
+    Captures the screen to send to the model, without the pre-capture
+    delay, see call_gemini_flash.
+    """
+    return _capture_screenshot(config.settings, session)
+
+def _capture_screenshot(settings, session=None):
+    screenshots_dir = "screenshots"
+    os.makedirs(screenshots_dir, exist_ok=True)
+    screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
+    frame_buffer = session.frame_buffer if session else get_frame_buffer()
+    frame = None
+    with span("capture"):
+        if frame_buffer:
+            # Background capture is running, so any frame from the last
+            # capture interval is fresh enough and costs nothing to read
+            frame = frame_buffer.wait_for_frame(
+                time.time() - frame_buffer.interval, settings.capture_timeout
+            )
+        if frame is not None:
+            screenshot = frame.image
+            if session is None:
+                screenshot.save(screenshot_filename)
+        elif session is not None:
+            # Sessions capture in memory, they would overwrite each
+            # other's screenshot file
+            screenshot = session.grab_screen()
+        else:
+            capture_screen_with_cursor(screenshot_filename)
+    if frame is None and session is None:
+        time.sleep(settings.post_capture_delay)
+        from PIL import Image
+
+        screenshot = Image.open(screenshot_filename)
+    return _observe_capture(session, screenshot)
+
+def _crop_to_window(screenshot, settings, session=None):
+    """
+    Returns the part of the screenshot the model should see, the region it
+    was cropped to (None for the whole screen) and the focused window box.
+    """
+    if settings.capture_region != "window":
+        return screenshot, None, None
+    window = session.focused_window() if session is not None else focused_window_box()
+    region = window_region(window, screenshot.size, settings.window_margin)
+    if region is None:
+        return screenshot, None, window
+    if config.verbose:
+        print("[call_gemini_flash] cropped to the focused window", region["box"])
+    return screenshot.crop(region["box"]), region, window
+
+def _label_screenshot(screenshot, session=None, region=None):
+    """
+    Returns the screenshot with its clickable elements labeled and the
+    label map, or the screenshot as is and None when YOLO is unavailable.
+    """
+    try:
+        yolo_model = get_yolo_model()
+    except Exception as e:
+        print(
+            f"{ANSI_GREEN}[MJAK]{ANSI_RED}[Error] Labeling unavailable, sending coordinates prompt.{ANSI_RESET}",
+            e,
+        )
+        return screenshot, None
+    session_id = session.id if session is not None else None
+    step = len(session.history) if session is not None else None
+    with span("label"):
+        labeled, coordinates = label_image(screenshot, yolo_model, session_id, step)
+    return labeled, {"coordinates": coordinates, "size": screenshot.size, "region": region}
 
-def call_gemini_flash(messages, objective):
+def call_gemini_flash(messages, objective, session=None, screenshot=None, state=None):
+    """
+    Captures the screen and asks Gemini for the next operations. A
+    `screenshot` captured by the caller (see SpeculativeStep) is sent as is,
+    skipping the pre-capture delay and the capture, and with a `state` dict
+    the screenshot, exchange and labels of the call are kept there instead
+    of replacing those of the last call. With the capture_region
+    setting at "window" only the focused window is sent, and coordinates
+    in the response are mapped back to the screen.
+    """
+    settings = config.settings
     if config.verbose:
         print("[MJAK][call_gemini_flash]")
-    time.sleep(1)
+    remember(session, state, exchange=None)
+    if screenshot is None:
+        time.sleep(settings.pre_capture_delay)
     try:
-        screenshots_dir = "screenshots"
-        os.makedirs(screenshots_dir, exist_ok=True)
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        capture_screen_with_cursor(screenshot_filename)
-        time.sleep(1)
-
-        prompt = get_system_prompt("gemini-1.5-flash", objective)
-        model = config.initialize_google()
+        if screenshot is None:
+            screenshot = _capture_screenshot(settings, session)
+
+        remember(session, state, screenshot=screenshot)
+        image, region, window = _crop_to_window(screenshot, settings, session)
+        labels = None
+        if settings.labeled_mode:
+            image, labels = _label_screenshot(image, session, region)
+            remember(session, state, labels=labels)
+        with span("encode"):
+            image_part = encode_image(
+                image,
+                settings.image_format,
+                settings.image_quality,
+                settings.image_max_width,
+            )
+
+        prompt = get_system_prompt("gemini-1.5-flash", objective, labeled=labels is not None)
+        model = config.get_google_model()
         if config.verbose:
             print("[call_gemini_flash] model", model)
 
-        response = model.generate_content([prompt, Image.open(screenshot_filename)])
-        content = response.text.strip()
+        governor = get_governor(settings)
+
+        def generate(timeout):
+            # The request gives up at the deadline instead of running on in
+            # the background
+            return model.generate_content(
+                [prompt, image_part], request_options={"timeout": timeout}
+            ).text
+
+        # One slot per model call, taken before the deadline starts: time
+        # spent queued must neither trigger hedges nor use up model_timeout.
+        # Retries and hedges are further requests, each takes its own token
+        with governor.slot(), span("model"):
+            started = time.perf_counter()
+            try:
+                content = get_model_caller().call(generate, admit=governor.take_token).strip()
+            except ModelCallException:
+                raise
+            except Exception as e:
+                raise ModelCallException(f"Gemini call failed: {e}") from e
+        exchange = {
+            "prompt": prompt,
+            "response": content,
+            "latency": time.perf_counter() - started,
+            "window": window,
+        }
+        remember(session, state, exchange=exchange)
         if config.verbose:
             print("[call_gemini_flash] raw response text:", content)
         if not content:
@@ -65,19 +307,38 @@ def call_gemini_flash(messages, objective):
         if config.verbose:
             print("[call_gemini_flash] extracted JSON text:", content_stripped)
         try:
-            content_json = json.loads(content_stripped)
-            if isinstance(content_json, list) and len(content_json) == 0:
+            with span("parse"):
+                content_json = json.loads(content_stripped)
+                operations = parse_actions(content_json, labels, region)
+            if not operations:
                 print("[Gemini Info] No actions returned by model. Ending operation loop.")
                 return [], None
-            return content_json, None
+            return operations, None
         except Exception as e:
-            print("[Gemini Error] Response not valid JSON after stripping codeblock. Full response:")
+            PARSE_FAILURES.inc()
+            print("[Gemini Error] Response is not a valid list of actions after stripping codeblock. Full response:")
             print(content)
             print("[Gemini Error] Extracted for JSON parsing:")
             print(content_stripped)
             raise e
 
+    except ModelOverloadedException as e:
+        print(
+            f"{ANSI_GREEN}[MJAK]{ANSI_BRIGHT_MAGENTA}[Operate] Model call shed. {ANSI_RESET}",
+            e,
+        )
+        raise
+    except ModelCallException as e:
+        # Surface the failure instead of pretending there was nothing to do
+        MODEL_ERRORS.inc()
+        print(
+            f"{ANSI_GREEN}[MJAK]{ANSI_BRIGHT_MAGENTA}[Operate] Gemini call failed. {ANSI_RESET}",
+            e,
+        )
+        raise
     except Exception as e:
+        if not isinstance(e, (json.JSONDecodeError, InvalidActionException)):
+            MODEL_ERRORS.inc()
         print(
             f"{ANSI_GREEN}[MJAK]{ANSI_BRIGHT_MAGENTA}[Operate] Gemini call failed. {ANSI_RESET}",
             e,
@@ -0,0 +1,206 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from operate.exceptions import ModelOverloadedException
+from operate.utils.metrics import MODEL_CALLS_IN_FLIGHT, MODEL_QUEUE_DEPTH, MODEL_SHED
+from operate.utils.timing import span
+
+# Who the current model call is made for (an API client, "cli", ...), used
+# to queue callers fairly. Set it per request, it follows asyncio.to_thread.
+current_caller = contextvars.ContextVar("current_caller", default="default")
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average with bursts of up to `burst`
+    calls. A rate of 0 disables the limit. Not thread safe on its own.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until_available(self):
+        """
+        Seconds until a token can be taken, 0 when one is available now.
+        """
+        if not self.rate:
+            return 0.0
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self._refill()
+            self._tokens -= 1
+
+
+class ModelCallGovernor:
+    """
+    Admits model calls at most `max_concurrency` at a time and at the rate
+    allowed by a token bucket. Waiting calls are served round robin across
+    callers, so one busy client cannot starve the others. Calls are shed
+    with ModelOverloadedException when `max_queue` calls are already
+    waiting or when a call waited longer than `max_wait` seconds.
+    """
+
+    def __init__(self, rate=0.0, burst=1, max_concurrency=4, max_queue=32, max_wait=30.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        # caller -> deque of waiting tickets, in round robin order
+        self._queues = OrderedDict()
+        self._queued = 0
+        self._active = 0
+
+    def configure(self, rate, burst, max_concurrency, max_queue, max_wait):
+        with self._cond:
+            self.bucket.rate = rate
+            self.bucket.burst = burst
+            self.max_concurrency = max_concurrency
+            self.max_queue = max_queue
+            self.max_wait = max_wait
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """
+        Rough number of seconds until a new call would be admitted.
+        """
+        with self._cond:
+            waiting = self._queued + 1
+        if self.bucket.rate:
+            return max(1, round(waiting / self.bucket.rate))
+        return max(1, round(self.max_wait))
+
+    def check(self):
+        """
+        Raises ModelOverloadedException when a new call would be shed, so
+        callers can reject a request before doing any work for it.
+        """
+        with self._cond:
+            full = self.max_queue and self._queued >= self.max_queue
+        if full:
+            MODEL_SHED.inc(reason="queue_full")
+            raise ModelOverloadedException(
+                f"{self.max_queue} model calls already queued", self.retry_after()
+            )
+
+    def _head(self):
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def _dequeue(self, caller, ticket, served=True):
+        queue = self._queues[caller]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[caller]
+        elif served:
+            # Served callers go to the back of the line
+            self._queues.move_to_end(caller)
+        self._queued -= 1
+        MODEL_QUEUE_DEPTH.set(self._queued)
+
+    def acquire(self, caller=None):
+        caller = caller if caller is not None else current_caller.get()
+        self.check()
+        ticket = object()
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            self._queues.setdefault(caller, deque()).append(ticket)
+            self._queued += 1
+            MODEL_QUEUE_DEPTH.set(self._queued)
+            while True:
+                remaining = deadline - time.monotonic()
+                timeout = remaining
+                if self._head() is ticket and self._active < self.max_concurrency:
+                    wait = self.bucket.time_until_available()
+                    if wait <= 0:
+                        self.bucket.take()
+                        self._dequeue(caller, ticket)
+                        self._active += 1
+                        MODEL_CALLS_IN_FLIGHT.set(self._active)
+                        self._cond.notify_all()
+                        return
+                    timeout = min(timeout, wait)
+                if remaining <= 0:
+                    self._dequeue(caller, ticket, served=False)
+                    self._cond.notify_all()
+                    break
+                self._cond.wait(timeout)
+        MODEL_SHED.inc(reason="timeout")
+        raise ModelOverloadedException(
+            f"no model call slot within {self.max_wait:g}s", self.retry_after()
+        )
+
+    def take_token(self, timeout=0.0):
+        """
+        Takes a rate limit token for one more request of an admitted call,
+        a retry or a hedge, waiting up to `timeout` seconds for it. Returns
+        False when none became available in time.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                wait = self.bucket.time_until_available()
+                if wait <= 0:
+                    self.bucket.take()
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(wait, remaining))
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            MODEL_CALLS_IN_FLIGHT.set(self._active)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, caller=None):
+        """
+        Holds a model call slot for the enclosed block.
+        """
+        with span("queue"):
+            self.acquire(caller)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor(settings):
+    """
+    Returns the shared ModelCallGovernor configured from `settings`.
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ModelCallGovernor()
+    _governor.configure(
+        settings.model_rate_limit,
+        settings.model_rate_burst,
+        settings.model_max_concurrency,
+        settings.model_max_queue,
+        settings.model_max_queue_wait,
+    )
+    return _governor
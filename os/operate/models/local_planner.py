@@ -0,0 +1,176 @@
+import re
+
+from operate.action import Action, Op
+from operate.models.prompts import get_platform_shortcuts
+from operate.utils.metrics import LOCAL_PLANS
+
+# The only apps the planner opens, spoken name to the name typed into the
+# OS search. Anything else ("run the tests", "start recording") goes to the
+# model
+KNOWN_APPS = {
+    "notepad": "Notepad",
+    "calculator": "Calculator",
+    "calc": "Calculator",
+    "paint": "Paint",
+    "browser": "Google Chrome",
+    "chrome": "Google Chrome",
+    "google chrome": "Google Chrome",
+    "firefox": "Firefox",
+    "safari": "Safari",
+    "cmd": "Command Prompt",
+    "command prompt": "Command Prompt",
+    "file explorer": "File Explorer",
+    "explorer": "File Explorer",
+    "finder": "Finder",
+    "files": "Files",
+    "terminal": "Terminal",
+    "textedit": "TextEdit",
+    "vs code": "Visual Studio Code",
+    "vscode": "Visual Studio Code",
+    "visual studio code": "Visual Studio Code",
+}
+
+# Keys a spoken "press ..." may name, mapped to pyautogui key names
+KEY_NAMES = {
+    "enter": "enter", "return": "enter", "escape": "esc", "esc": "esc",
+    "tab": "tab", "space": "space", "spacebar": "space", "backspace": "backspace",
+    "delete": "delete", "up": "up", "down": "down", "left": "left", "right": "right",
+    "home": "home", "end": "end", "pageup": "pageup", "pagedown": "pagedown", "ctrl": "ctrl", "control": "ctrl",
+    "alt": "alt", "shift": "shift", "win": "win", "windows": "win", "super": "win",
+    "command": "command", "cmd": "command",
+}
+KEY_NAMES.update({f"f{number}": f"f{number}" for number in range(1, 13)})
+
+# Editing commands to the letter pressed with the platform's cmd key
+EDIT_SHORTCUTS = {
+    "copy": "c",
+    "paste": "v",
+    "cut": "x",
+    "undo": "z",
+    "redo": "y",
+    "select all": "a",
+    "save": "s",
+    "new tab": "t",
+    "close tab": "w",
+}
+
+POLITE = re.compile(r"^(please |can you |could you |would you |hey |ok |okay )+", re.IGNORECASE)
+CLAUSE_SEPARATOR = re.compile(
+    r"\s*(?:,\s*and then|,\s*then|\band then\b|\bthen\b|,|\band\b)\s+", re.IGNORECASE
+)
+# "type 2+2, then press enter": a key press after the typed text
+TRAILING_PRESS = re.compile(
+    r"(?:\s*,\s*(?:and\s+)?(?:then\s+)?|\s+and\s+(?:then\s+)?|\s+then\s+)(?=(?:press|hit)\s)",
+    re.IGNORECASE,
+)
+
+OPEN = re.compile(
+    r"^(?:open|launch)\s+(?:up\s+)?(?:the\s+|my\s+)?"
+    r"(?P<app>.+?)(?:\s+app(?:lication)?)?$",
+    re.IGNORECASE,
+)
+# Only quoted text is typed as is, "type a poem about cats" is a task
+TYPE = re.compile(r"^type\s+(?P<quote>[\"'])(?P<text>.*)(?P=quote)$", re.IGNORECASE)
+PRESS = re.compile(r"^(?:press|hit|push)\s+(?:the\s+)?(?P<keys>.+?)(?:\s+keys?)?$", re.IGNORECASE)
+CLOSE = re.compile(
+    r"^close\s+(?:the\s+|this\s+|the current\s+|current\s+)?(?:window|app|application|program)$",
+    re.IGNORECASE,
+)
+
+
+def _action(op, thought, **fields):
+    return Action(op, f"Local fast path: {thought}", **fields)
+
+
+def _app_name(name):
+    return KNOWN_APPS.get(" ".join(name.strip().strip(".").lower().split()))
+
+
+def _parse_keys(spoken):
+    keys = []
+    spoken = re.sub(r"\bpage\s+(up|down)\b", r"page\1", spoken.strip().lower())
+    for part in re.split(r"\s*(?:\+|\bplus\b)\s*|\s+", spoken):
+        if not part:
+            continue
+        if part in KEY_NAMES:
+            keys.append(KEY_NAMES[part])
+        elif len(part) == 1 and part.isalnum():
+            keys.append(part)
+        else:
+            return None
+    return keys or None
+
+
+def _plan_clause(clause, shortcuts):
+    clause = clause.strip().rstrip(".!")
+    lowered = clause.lower()
+
+    if CLOSE.match(clause):
+        return [_action(Op.PRESS, "close the focused window", keys=tuple(shortcuts["close_window_keys"]))]
+
+    if lowered in EDIT_SHORTCUTS:
+        return [
+            _action(Op.PRESS, lowered, keys=(shortcuts["cmd_key"], EDIT_SHORTCUTS[lowered]))
+        ]
+
+    match = TYPE.match(clause)
+    if match:
+        return [_action(Op.WRITE, "type the requested text", content=match.group("text"))]
+
+    match = PRESS.match(clause)
+    if match:
+        keys = _parse_keys(match.group("keys"))
+        if keys:
+            return [_action(Op.PRESS, "press the requested keys", keys=tuple(keys))]
+        return None
+
+    match = OPEN.match(clause)
+    if match:
+        app = _app_name(match.group("app"))
+        if app:
+            return [
+                _action(Op.PRESS, "open the OS search", keys=tuple(shortcuts["search_keys"])),
+                _action(Op.WRITE, f"search for {app}", content=app),
+                _action(Op.PRESS, f"launch {app}", keys=("enter",)),
+            ]
+    return None
+
+
+def _split_clauses(objective):
+    # The text to type may contain "and" or commas, so it ends the split
+    match = re.search(r"\btype\s+[\"']", objective, re.IGNORECASE)
+    head, tail = objective, ""
+    if match:
+        head, tail = objective[: match.start()], objective[match.start():]
+    clauses = [clause for clause in CLAUSE_SEPARATOR.split(head) if clause.strip()]
+    if re.match(r"^\w+\s+([\"']).*\1$", tail):
+        # Quoted text is typed as is
+        clauses.append(tail)
+    elif tail:
+        clauses.extend(TRAILING_PRESS.split(tail, maxsplit=1))
+    return clauses
+
+
+def plan_locally(objective):
+    """
+    Compiles trivial objectives ("open notepad", 'type "hello world"',
+    "close window", 'open calculator and type "2+2"') into Actions without
+    calling the model. Every clause has to be recognized, otherwise None is
+    returned and the caller falls back to the model.
+
+    The plan does not end with `done`: the next step goes to the model,
+    which confirms the objective was reached or carries on.
+    """
+    objective = POLITE.sub("", (objective or "").strip())
+    if not objective:
+        return None
+    shortcuts = get_platform_shortcuts()
+    operations = []
+    for clause in _split_clauses(objective):
+        clause_operations = _plan_clause(clause, shortcuts)
+        if clause_operations is None:
+            LOCAL_PLANS.inc(outcome="miss")
+            return None
+        operations.extend(clause_operations)
+    LOCAL_PLANS.inc(outcome="hit")
+    return operations
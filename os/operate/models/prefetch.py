@@ -0,0 +1,108 @@
+import contextvars
+import threading
+import time
+
+from operate.exceptions import ModelCallException
+from operate.models.apis import call_gemini_flash, capture_frame, remember
+from operate.utils.metrics import PREFETCHES
+from operate.utils.timing import span
+from operate.utils.verify import diff_ratio
+
+
+class SpeculativeStep:
+    """
+    Prefetches the next model call while the last action of a plan is still
+    running: waits `delay` seconds from the moment it is started, captures
+    the screen and sends it to the model on a background thread.
+
+    Once the plan has finished, take() captures the screen again and returns
+    the prefetched operations when no more than `threshold` of its pixels
+    changed since the speculative capture. Otherwise the prefetch is
+    cancelled and the caller makes a fresh call.
+    """
+
+    def __init__(self, messages, objective, session=None, delay=1.0, threshold=0.0001):
+        self.messages = messages
+        self.objective = objective
+        self.session = session
+        self.delay = delay
+        self.threshold = threshold
+        self.screenshot = None
+        self.captured_at = None
+        self.result = None
+        self.error = None
+        # Screenshot, exchange and labels of the speculative call, published
+        # only when it is taken
+        self.state = {}
+        self._captured = threading.Event()
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # The call is made for the caller, its context (current_caller) goes along
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(
+            target=context.run, args=(self._run,), name="mjak-prefetch", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        # A model call already in flight cannot be interrupted, its result
+        # is dropped
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _run(self):
+        if self._cancelled.wait(self.delay):
+            return
+        try:
+            with span("capture"):
+                self.screenshot = capture_frame(self.session)
+            self.captured_at = time.time()
+        except Exception as e:
+            self.error = e
+            return
+        finally:
+            self._captured.set()
+        if self._cancelled.is_set():
+            return
+        try:
+            self.result = call_gemini_flash(
+                self.messages,
+                self.objective,
+                self.session,
+                screenshot=self.screenshot,
+                state=self.state,
+            )
+        except Exception as e:
+            self.error = e
+
+    def take(self):
+        """
+        Returns the prefetched (operations, session_id) when the screen has
+        not changed since the speculative capture, None otherwise. A model
+        call that failed for good is raised as it would be without prefetch.
+        """
+        self._captured.wait()
+        if self.error is not None and self.screenshot is None:
+            PREFETCHES.inc(outcome="error")
+            return None
+        current = capture_frame(self.session, after=self.captured_at)
+        if diff_ratio(self.screenshot, current) > self.threshold:
+            self.cancel()
+            PREFETCHES.inc(outcome="stale")
+            return None
+        self._thread.join()
+        if isinstance(self.error, ModelCallException):
+            PREFETCHES.inc(outcome="error")
+            raise self.error
+        if self.error is not None or self.result is None:
+            PREFETCHES.inc(outcome="error")
+            return None
+        remember(self.session, None, **self.state)
+        PREFETCHES.inc(outcome="hit")
+        return self.result
@@ -1,3 +1,4 @@
+import json
 import platform
 from operate.config import Config
 
@@ -207,25 +208,49 @@ Please take the next best action. The `pyautogui` library will be used to execut
 Action:"""
 
 
-def get_system_prompt(model, objective):
+def get_platform_shortcuts():
     """
-    Format the vision prompt more efficiently and print the name of the prompt used
+    Returns the shortcuts of the current OS used in the prompts and by the
+    local planner:
+    - operating_system: "Mac", "Windows" or "Linux"
+    - cmd_key: the modifier for app shortcuts (copy, address bar, ...)
+    - search_keys: the keys that open the OS search
+    - close_window_keys: the keys that close the focused window
     """
-
     if platform.system() == "Darwin":
-        cmd_string = "\"command\""
-        os_search_str = "[\"command\", \"space\"]"
-        operating_system = "Mac"
+        return {
+            "operating_system": "Mac",
+            "cmd_key": "command",
+            "search_keys": ["command", "space"],
+            "close_window_keys": ["command", "w"],
+        }
     elif platform.system() == "Windows":
-        cmd_string = "\"ctrl\""
-        os_search_str = "[\"win\"]"
-        operating_system = "Windows"
-    else:
-        cmd_string = "\"ctrl\""
-        os_search_str = "[\"win\"]"
-        operating_system = "Linux"
+        return {
+            "operating_system": "Windows",
+            "cmd_key": "ctrl",
+            "search_keys": ["win"],
+            "close_window_keys": ["alt", "f4"],
+        }
+    return {
+        "operating_system": "Linux",
+        "cmd_key": "ctrl",
+        "search_keys": ["win"],
+        "close_window_keys": ["alt", "f4"],
+    }
+
+
+def get_system_prompt(model, objective, labeled=False):
+    """
+    Format the vision prompt more efficiently and print the name of the prompt used.
+    `labeled` selects the set-of-marks prompt for screenshots with labels.
+    """
+
+    shortcuts = get_platform_shortcuts()
+    cmd_string = json.dumps(shortcuts["cmd_key"])
+    os_search_str = json.dumps(shortcuts["search_keys"])
+    operating_system = shortcuts["operating_system"]
 
-    if model == "gpt-4-with-som":
+    if labeled or model == "gpt-4-with-som":
         prompt = SYSTEM_PROMPT_LABELED.format(
             objective=objective,
             cmd_string=cmd_string,
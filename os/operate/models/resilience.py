@@ -0,0 +1,178 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from operate.exceptions import ModelCallException
+from operate.utils.metrics import (
+    MODEL_DEADLINES_EXCEEDED,
+    MODEL_HEDGE_WINS,
+    MODEL_HEDGES,
+    MODEL_RETRIES,
+)
+from operate.utils.timing import percentile
+
+# Error class names (from google.api_core, requests, urllib3, ...) worth
+# retrying, matched by name so the client libraries are not imported here
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "DeadlineExceeded",
+    "GatewayTimeout",
+    "BadGateway",
+    "Aborted",
+    "ConnectionError",
+    "Timeout",
+    "ReadTimeout",
+    "ConnectTimeout",
+    "ProtocolError",
+}
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent successful calls.
+    """
+
+    def __init__(self, size=200):
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, p, min_samples=1):
+        with self._lock:
+            latencies = list(self._latencies)
+        if len(latencies) < min_samples:
+            return None
+        return percentile(latencies, p)
+
+
+class ResilientCaller:
+    """
+    Runs a blocking call with a deadline, retries retryable errors with
+    exponential backoff and full jitter, and hedges slow attempts: when an
+    attempt is slower than the given percentile of recent latencies a
+    duplicate is started and whichever finishes first wins.
+
+    Each attempt is called as fn(timeout) with the seconds left until the
+    deadline, to pass on as its request timeout: attempts cannot be
+    interrupted, the ones that lose a hedge or miss the deadline finish in
+    the background and their result is dropped. They run on daemon threads
+    so one still in flight does not hold up the process exit.
+
+    When given, admit(timeout) is called before every request after the
+    first one and returns False to refuse it (see
+    ModelCallGovernor.take_token): a retry waits up to the deadline for it,
+    a hedge is skipped unless it is admitted right away.
+    """
+
+    def __init__(
+        self,
+        deadline=60.0,
+        max_retries=2,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        hedge_percentile=95,
+        hedge_min_samples=10,
+    ):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = LatencyTracker()
+
+    def call(self, fn, admit=None):
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return self._call_hedged(fn, deadline_at, admit)
+            except ModelCallException:
+                raise
+            except Exception as e:
+                remaining = deadline_at - time.monotonic()
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if not is_retryable(e) or attempt >= self.max_retries or delay >= remaining:
+                    raise
+                print(f"[ResilientCaller] retrying in {delay:.2f}s after error:", e)
+                time.sleep(delay)
+                if admit is not None and not admit(deadline_at - time.monotonic()):
+                    raise
+                MODEL_RETRIES.inc()
+                attempt += 1
+
+    def _submit(self, fn, deadline_at):
+        future = Future()
+        # Attempts run in the caller's context, e.g. its current_caller
+        context = contextvars.copy_context()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise ModelCallException("deadline passed before the attempt started")
+                result = context.run(fn, remaining)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        threading.Thread(target=run, name="mjak-model-call", daemon=True).start()
+        return future
+
+    def _call_hedged(self, fn, deadline_at, admit=None):
+        started = time.monotonic()
+        pending = {self._submit(fn, deadline_at)}
+        hedge_after = None
+        if self.hedge_percentile:
+            hedge_after = self.latencies.percentile(self.hedge_percentile, self.hedge_min_samples)
+        hedged = None
+        error = None
+
+        while pending:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = remaining
+            if hedged is None and hedge_after is not None:
+                timeout = min(timeout, max(0.0, started + hedge_after - time.monotonic()))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.latencies.record(time.monotonic() - started)
+                    if future is hedged:
+                        MODEL_HEDGE_WINS.inc()
+                    return future.result()
+                error = future.exception()
+            if hedged is None and hedge_after is not None and pending:
+                now = time.monotonic()
+                if now - started >= hedge_after and now < deadline_at:
+                    if admit is not None and not admit(0.0):
+                        # No budget for a duplicate, wait for the first one
+                        hedge_after = None
+                        continue
+                    MODEL_HEDGES.inc()
+                    hedged = self._submit(fn, deadline_at)
+                    pending.add(hedged)
+
+        if pending:
+            MODEL_DEADLINES_EXCEEDED.inc()
+            raise ModelCallException(f"no response within the {self.deadline:g}s deadline")
+        raise error
@@ -0,0 +1,36 @@
+import os
+import threading
+
+WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "weights", "best.pt")
+
+_lock = threading.Lock()
+_yolo_model = None
+_ocr_reader = None
+
+
+def get_yolo_model():
+    """
+    Returns the YOLO button detector used to label screenshots, loading the
+    weights on first use. Requires `ultralytics`.
+    """
+    global _yolo_model
+    with _lock:
+        if _yolo_model is None:
+            from ultralytics import YOLO
+
+            _yolo_model = YOLO(WEIGHTS_PATH)
+        return _yolo_model
+
+
+def get_ocr_reader():
+    """
+    Returns the EasyOCR reader, loading the models on first use. Requires
+    `easyocr`.
+    """
+    global _ocr_reader
+    with _lock:
+        if _ocr_reader is None:
+            import easyocr
+
+            _ocr_reader = easyocr.Reader(["en"])
+        return _ocr_reader
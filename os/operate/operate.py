@@ -2,9 +2,10 @@ import sys
 import os
 import time
 import asyncio
-from prompt_toolkit.shortcuts import message_dialog
-from prompt_toolkit import prompt
+import threading
+from dataclasses import asdict
 from operate.exceptions import ModelNotRecognizedException
+from operate.action import Op, to_dicts
 import platform
 
 from operate.models.prompts import (
@@ -19,10 +20,23 @@ from operate.utils.style import (
     ANSI_RED,
     ANSI_BRIGHT_MAGENTA,
     ANSI_BLUE,
-    style,
 )
 from operate.utils.operating_system import OperatingSystem
-from operate.models.apis import get_next_action
+from operate.utils.timing import span, timings
+from operate.utils.plan import ExecutionTimeline, compile_plan, expected_duration
+from operate.utils.verify import RETARGET_OFFSETS, VERIFIED_OPERATIONS, ActionVerifier
+from operate.utils.metrics import ACTION_RETRIES, ACTION_VERIFICATIONS
+from operate.utils.trace import TraceRecorder, trace_path
+from operate.utils.runtime import STAGE_GRACE, in_thread, run_stage
+from operate.models.apis import (
+    capture_for_model,
+    capture_frame,
+    get_last_exchange,
+    get_last_screenshot,
+    get_model_call,
+)
+from operate.models.prefetch import SpeculativeStep
+from operate.models.local_planner import plan_locally
 
 # Load configuration
 config = Config()
@@ -45,6 +59,9 @@ def main(model, terminal_prompt, verbose_mode=False):
 
     # Skip message dialog if prompt was given directly
     if not terminal_prompt:
+        from prompt_toolkit.shortcuts import message_dialog
+        from operate.utils.style import style
+
         message_dialog(
             title="MJAK",
             text="Let's automate your life",
@@ -66,89 +83,500 @@ def main(model, terminal_prompt, verbose_mode=False):
             f"[{ANSI_GREEN}MJAK {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]\n{USER_QUESTION}"
         )
         print(f"{ANSI_YELLOW}[User]{ANSI_RESET}")
+        from prompt_toolkit import prompt
+        from operate.utils.style import style
+
         objective = prompt(style=style)
 
-    system_prompt = get_system_prompt(model, objective)
-    system_message = {"role": "system", "content": system_prompt}
-    messages = [system_message]
+    run_objective(model, objective)
+
+
+def objective_messages(model, objective):
+    return [{"role": "system", "content": get_system_prompt(model, objective)}]
+
+
+def plan_first_step(model, objective, session=None):
+    """
+    Starts planning the first step of `objective` in the background, see
+    SpeculativeStep. Returns None when the local planner handles it.
+    """
+    settings = config.settings
+    if settings.local_planner and plan_locally(objective):
+        return None
+    return SpeculativeStep(
+        objective_messages(model, objective),
+        objective,
+        session,
+        delay=settings.pre_capture_delay,
+        threshold=settings.prefetch_diff_threshold,
+    ).start()
+
+
+def run_objective(model, objective, session=None, prefetch=None, next_objective=None):
+    """
+    Runs the agent loop for an objective on an event loop of its own, for
+    callers outside of one. See run_objective_async.
+    """
+    return asyncio.run(run_objective_async(model, objective, session, prefetch, next_objective))
+
+
+def stage_timeouts(settings):
+    """
+    Seconds each stage of the agent loop may take, within the objective's
+    deadline. The capture stage includes the pre-capture delay, the model
+    stage the wait for a free model slot.
+    """
+    return {
+        "capture": settings.pre_capture_delay
+        + settings.capture_timeout
+        + settings.post_capture_delay
+        + STAGE_GRACE,
+        "model": settings.model_max_queue_wait + settings.model_timeout + STAGE_GRACE,
+        "execute": settings.execute_timeout,
+    }
+
+
+async def plan_step(model, messages, objective, session=None, deadline=None):
+    """
+    Waits for the screen to settle, captures it and asks the model for the
+    next operations. Returns (operations, session_id).
+    """
+    call = get_model_call(model)
+    settings = config.settings
+    timeouts = stage_timeouts(settings)
+
+    async def capture():
+        await asyncio.sleep(settings.pre_capture_delay)
+        return await in_thread(capture_for_model, session)
+
+    screenshot = await run_stage("capture", capture(), timeouts["capture"], deadline)
+    return await run_stage(
+        "model",
+        in_thread(call, messages, objective, session, screenshot),
+        timeouts["model"],
+        deadline,
+    )
+
+
+async def execute_step(
+    operations,
+    model,
+    timeline,
+    session=None,
+    before_last=None,
+    before_done=None,
+    deadline=None,
+):
+    """
+    Executes operations on a worker thread, see operate. When the execute
+    stage times out or is cancelled the plan stops after the operation in
+    progress, which is waited for, rather than leaving input half done.
+    """
+    cancelled = threading.Event()
+    execution = in_thread(
+        operate, operations, model, timeline, session, before_last, before_done, cancelled
+    )
+    try:
+        return await run_stage(
+            "execute",
+            asyncio.shield(execution),
+            stage_timeouts(config.settings)["execute"],
+            deadline,
+        )
+    except BaseException:
+        cancelled.set()
+        await asyncio.wait([execution])
+        raise
+
+
+async def run_objective_async(model, objective, session=None, prefetch=None, next_objective=None):
+    """
+    Runs the agent loop for an objective until it is complete, the model
+    returns no operations, the iteration limit is hit or its deadline
+    (objective_timeout) passes. With a `session` the loop captures and acts
+    on the session's display and records every step in its history. With
+    the trace_dir setting every step is recorded in a trace file (see
+    operate.utils.trace).
+
+    Capture, model calls and execution run on worker threads, each stage
+    bounded by its timeout (see stage_timeouts) and the deadline. When the
+    loop is cancelled (Ctrl-C) the plan being executed stops after its
+    current operation, background planning is dropped and the trace is
+    closed before CancelledError is raised again.
+
+    `prefetch` is a SpeculativeStep already planning the first step (see
+    plan_first_step). When `next_objective` is given and the objective
+    completes, planning its first step starts while the last actions are
+    still running, with the speculative_prefetch setting.
+
+    Returns a dict with:
+    - completed: True if the loop stopped on a `done` operation
+    - steps: the number of model calls made
+    - frame: the last screenshot sent to the model, kept in memory
+    - error: the error that stopped the loop, if any
+    - sources: where each step's operations came from ("model",
+      "prefetch" or "local")
+    - timings: seconds spent in total, waiting for plans and executing
+    - handoff: the SpeculativeStep planning next_objective, or None
+    """
+    messages = objective_messages(model, objective)
 
     loop_count = 0
+    steps = 0
+    completed = False
+    cancelled = False
+    error = None
     session_id = None
+    trace = None
+    handoff = None
+    sources = []
+    started = time.perf_counter()
+    planning = execution = 0.0
+    deadline = None
+    if config.settings.objective_timeout:
+        deadline = time.monotonic() + config.settings.objective_timeout
+    if config.settings.trace_dir:
+        trace = TraceRecorder(
+            trace_path(config.settings.trace_dir, objective),
+            objective,
+            model,
+            asdict(config.settings),
+        )
 
-    while True:
-        if config.verbose:
-            print("[MJAK] loop_count", loop_count)
-        try:
-            operations, session_id = asyncio.run(
-                get_next_action(model, messages, objective, session_id)
-            )
-            if not operations:
-                print(f"{ANSI_GREEN}[MJAK]{ANSI_RESET} No operations to perform, exiting.")
-                break
-            stop = operate(operations, model)
-            if stop:
+    def speculate():
+        # The last action of the plan is being dispatched, start settling,
+        # capturing and calling the model for the next step right away
+        nonlocal prefetch
+        settings = config.settings
+        prefetch = SpeculativeStep(
+            messages,
+            objective,
+            session,
+            delay=settings.pre_capture_delay,
+            threshold=settings.prefetch_diff_threshold,
+        ).start()
+
+    def hand_off():
+        # This plan completes the objective, plan the next one while its
+        # last actions run
+        nonlocal handoff
+        handoff = plan_first_step(model, next_objective, session)
+
+    try:
+        while True:
+            if config.verbose:
+                print("[MJAK] loop_count", loop_count)
+            try:
+                with span("step"):
+                    planning_started = time.perf_counter()
+                    result = None
+                    source = "model"
+                    if steps == 0 and config.settings.local_planner:
+                        # Trivial objectives are compiled without a model call
+                        local_operations = plan_locally(objective)
+                        if local_operations:
+                            result = local_operations, session_id
+                            source = "local"
+                            if prefetch is not None:
+                                prefetch.cancel()
+                                prefetch = None
+                    steps += 1
+                    if prefetch is not None:
+                        speculative, prefetch = prefetch, None
+                        try:
+                            result = await run_stage(
+                                "model",
+                                in_thread(speculative.take),
+                                stage_timeouts(config.settings)["model"],
+                                deadline,
+                            )
+                        except BaseException:
+                            speculative.cancel()
+                            raise
+                        source = "prefetch"
+                    if result is None:
+                        result = await plan_step(model, messages, objective, session, deadline)
+                        source = "model"
+                    planning += time.perf_counter() - planning_started
+                    sources.append(source)
+                    operations, session_id = result
+                    if trace is not None:
+                        trace_step(trace, session, operations, source)
+                    if not operations:
+                        print(f"{ANSI_GREEN}[MJAK]{ANSI_RESET} No operations to perform, exiting.")
+                        break
+                    timeline = ExecutionTimeline()
+                    settings = config.settings
+                    last_step = loop_count + 1 > settings.max_iterations
+                    before_last = None
+                    if settings.speculative_prefetch and not last_step:
+                        before_last = speculate
+                    before_done = None
+                    if settings.speculative_prefetch and next_objective:
+                        before_done = hand_off
+                    execution_started = time.perf_counter()
+                    try:
+                        stop = await execute_step(
+                            operations, model, timeline, session, before_last, before_done, deadline
+                        )
+                    finally:
+                        execution += time.perf_counter() - execution_started
+                        if session is not None:
+                            session.record_step(objective, operations, timeline)
+                        if trace is not None:
+                            trace.record_timeline(timeline)
+                if stop:
+                    completed = True
+                    break
+                loop_count += 1
+                if loop_count > config.settings.max_iterations:
+                    break
+            except ModelNotRecognizedException as e:
+                error = e
+                print(
+                    f"{ANSI_GREEN}[MJAK]{ANSI_RED}[Error] -> {e} {ANSI_RESET}"
+                )
                 break
-            loop_count += 1
-            if loop_count > 10:
+            except Exception as e:
+                error = e
+                print(
+                    f"{ANSI_GREEN}[MJAK]{ANSI_RED}[Error] -> {e} {ANSI_RESET}"
+                )
                 break
-        except ModelNotRecognizedException as e:
-            print(
-                f"{ANSI_GREEN}[MJAK]{ANSI_RED}[Error] -> {e} {ANSI_RESET}"
-            )
-            break
-        except Exception as e:
-            print(
-                f"{ANSI_GREEN}[MJAK]{ANSI_RED}[Error] -> {e} {ANSI_RESET}"
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        if prefetch is not None:
+            prefetch.cancel()
+        if handoff is not None and not completed:
+            # The next objective was planned for a screen this one did not reach
+            handoff.cancel()
+            handoff = None
+        if trace is not None:
+            end = {"completed": completed, "steps": steps}
+            if cancelled:
+                end["cancelled"] = True
+            trace.record_end(end)
+            trace.close()
+
+    frame = session.last_screenshot if session is not None else get_last_screenshot()
+    return {
+        "completed": completed,
+        "steps": steps,
+        "frame": frame,
+        "error": error,
+        "sources": sources,
+        "timings": {
+            "total": time.perf_counter() - started,
+            "planning": planning,
+            "execution": execution,
+        },
+        "handoff": handoff,
+    }
+
+
+def trace_step(trace, session, operations, source):
+    """
+    Records the frame and model exchange behind `operations`, unless they
+    were planned locally, then the operations themselves.
+    """
+    if source != "local":
+        if session is not None:
+            screenshot, exchange = session.last_screenshot, session.last_exchange
+        else:
+            screenshot, exchange = get_last_screenshot(), get_last_exchange()
+        frame = trace.record_frame(screenshot) if screenshot is not None else None
+        if exchange is not None:
+            trace.record_model(
+                frame,
+                exchange["prompt"],
+                exchange["response"],
+                exchange["latency"],
+                exchange.get("window"),
             )
-            break
+    trace.record_actions(to_dicts(operations), source)
+
+def operate(
+    operations,
+    model,
+    timeline=None,
+    session=None,
+    before_last=None,
+    before_done=None,
+    cancelled=None,
+):
+    """
+    Executes the Actions returned by the model.
+
+    The operations are compiled first (see compile_plan) so settle waits only
+    happen after expected UI transitions. When a timeline is given, the
+    expected and actual duration of every executed operation is recorded on
+    it. With a `session` the operations go to the session's input backend.
+    `before_last` is called right before the last operation is dispatched,
+    unless the plan ends with `done`, then `before_done` is called right
+    before its last input operation instead. With the verify_actions
+    setting every click is checked for a visible change (see
+    ActionVerifier) and retried slightly nudged when nothing changed. Once
+    the `cancelled` event is set no further operation is started.
 
-def operate(operations, model):
+    Returns True if the objective is complete or the loop should stop.
+    """
     if config.verbose:
         print("[MJAK][operate]")
-    for operation in operations:
-        if config.verbose:
-            print("[MJAK][operate] operation", operation)
-        time.sleep(1)
-        operate_type = operation.get("operation", "").lower()
-        operate_thought = operation.get("thought", "")
-        operate_detail = ""
-        if config.verbose:
-            print("[MJAK][operate] operate_type", operate_type)
-
-        if operate_type == "press" or operate_type == "hotkey":
-            keys = operation.get("keys", [])
-            operate_detail = keys
-            operating_system.press(keys)
-        elif operate_type == "write":
-            content = operation.get("content", "")
-            operate_detail = content
-            operating_system.write(content)
-        elif operate_type == "click":
-            x = operation.get("x")
-            y = operation.get("y")
-            click_detail = {"x": x, "y": y}
-            operate_detail = click_detail
-            operating_system.mouse(click_detail)
-        elif operate_type == "done":
-            summary = operation.get("summary", "")
-            print(
-                f"[{ANSI_GREEN}MJAK {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
+    if timeline is None:
+        timeline = ExecutionTimeline()
+    plan = compile_plan(operations, config.settings.settle_delay)
+    if config.verbose:
+        print("[MJAK][operate] compiled plan", plan)
+    try:
+        with span("execute"):
+            system = session.operating_system if session is not None else operating_system
+            verifier = None
+            settings = config.settings
+            if settings.verify_actions:
+                verifier = ActionVerifier(
+                    lambda: capture_frame(session),
+                    settings.verify_delay,
+                    settings.verify_radius,
+                    settings.verify_local_threshold,
+                    settings.verify_global_threshold,
+                )
+            return execute_plan(
+                plan, model, timeline, system, before_last, verifier, before_done, cancelled
             )
-            print(f"{ANSI_BLUE}Objective Complete: {ANSI_RESET}{summary}\n")
-            return True
-        else:
+    finally:
+        if config.verbose:
+            print(f"[MJAK][operate] timeline\n{timeline.summary()}")
+
+
+def record_operation(timeline, operation, actual, verification=None):
+    timeline.record(operation, expected_duration(operation), actual, verification)
+    timings.record(OPERATION_SPANS[operation.op], actual)
+
+
+def verify_operation(verifier, system, operation, before):
+    """
+    Checks that an operation visibly changed the screen, retrying a click
+    that did not slightly nudged, never on the same point. Returns
+    (verification, frame after the operation).
+    """
+    x, y = operation.x, operation.y
+    verification, frame = verifier.check(before, x, y)
+    retries = 0
+    if x is not None:
+        while (
+            verification is not None
+            and not verification["changed"]
+            and retries < config.settings.verify_retries
+        ):
+            dx, dy = RETARGET_OFFSETS[retries % len(RETARGET_OFFSETS)]
+            retries += 1
+            ACTION_RETRIES.inc()
             print(
-                f"{ANSI_GREEN}[MJAK]{ANSI_RED}[Error] unknown operation response :({ANSI_RESET}"
+                f"{ANSI_GREEN}[MJAK]{ANSI_YELLOW} No visible change after the click, "
+                f"retrying at ({x + dx:.2f}, {y + dy:.2f}){ANSI_RESET}"
             )
+            system.click_at_percentage(x + dx, y + dy)
+            verification, frame = verifier.check(before, x + dx, y + dy)
+    if verification is None:
+        ACTION_VERIFICATIONS.inc(operation=operation.op.value, outcome="unknown")
+    else:
+        verification["retries"] = retries
+        outcome = "changed" if verification["changed"] else "unchanged"
+        ACTION_VERIFICATIONS.inc(operation=operation.op.value, outcome=outcome)
+    return verification, frame
+
+
+def _press(system, action, cancelled=None):
+    system.press(action.keys)
+    return list(action.keys)
+
+
+def _write(system, action, cancelled=None):
+    # Long text is the only operation worth interrupting half way
+    system.write(action.content, cancelled)
+    return action.content
+
+
+def _click(system, action, cancelled=None):
+    system.click_at_percentage(action.x, action.y)
+    return {"x": action.x, "y": action.y}
+
+
+# Input operations to the function that dispatches them, called as
+# (system, action, cancelled), and returns the detail to print. Wait and
+# done control the loop itself
+EXECUTORS = {Op.PRESS: _press, Op.HOTKEY: _press, Op.WRITE: _write, Op.CLICK: _click}
+OPERATION_SPANS = {op: f"operation.{op.value}" for op in Op}
+
+
+def execute_plan(
+    plan,
+    model,
+    timeline,
+    system=operating_system,
+    before_last=None,
+    verifier=None,
+    before_done=None,
+    cancelled=None,
+):
+    # Frame known to show the current screen, reused as the next "before"
+    frame = None
+    # Time spent waiting for verification, taken off the next settle wait
+    verified_for = 0.0
+    # Waits end early when the plan is cancelled
+    pause = cancelled.wait if cancelled is not None else time.sleep
+    hook, last = before_last, len(plan) - 1
+    if plan and plan[-1].op is Op.DONE:
+        hook, last = before_done, -1
+        for index, operation in enumerate(plan):
+            if operation.op in EXECUTORS:
+                last = index
+    for index, operation in enumerate(plan):
+        if cancelled is not None and cancelled.is_set():
+            break
+        op = operation.op
+        if config.verbose:
+            print("[MJAK][operate] operation", operation)
+        if hook is not None and index == last:
+            hook()
+
+        if op is Op.WAIT:
+            started = time.perf_counter()
+            pause(max(0.0, operation.seconds - verified_for))
+            verified_for = 0.0
+            frame = None
+            record_operation(timeline, operation, time.perf_counter() - started)
+            continue
+        if op is Op.DONE:
+            record_operation(timeline, operation, 0.0)
             print(
-                f"{ANSI_GREEN}[MJAK]{ANSI_RED}[Error] AI response {ANSI_RESET}{operation}"
+                f"[{ANSI_GREEN}MJAK {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
             )
+            print(f"{ANSI_BLUE}Objective Complete: {ANSI_RESET}{operation.summary}\n")
             return True
+        verify = verifier is not None and op in VERIFIED_OPERATIONS
+        if verify and frame is None:
+            frame = verifier.capture()
+        started = time.perf_counter()
+        operate_detail = EXECUTORS[op](system, operation, cancelled)
 
+        actual = time.perf_counter() - started
+        verification = None
+        if verify:
+            verify_started = time.perf_counter()
+            verification, frame = verify_operation(verifier, system, operation, frame)
+            verified_for = time.perf_counter() - verify_started
+        else:
+            frame = None
+        record_operation(timeline, operation, actual, verification)
         print(
             f"[{ANSI_GREEN}MJAK {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
         )
-        print(f"{operate_thought}")
-        print(f"{ANSI_BLUE}Action: {ANSI_RESET}{operate_type} {operate_detail}\n")
+        print(f"{operation.thought}")
+        print(f"{ANSI_BLUE}Action: {ANSI_RESET}{op.value} {operate_detail}\n")
+        if verification is not None and not verification["changed"]:
+            print(f"{ANSI_GREEN}[MJAK]{ANSI_YELLOW} The screen did not change{ANSI_RESET}\n")
 
     return False
\ No newline at end of file
@@ -0,0 +1,227 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+from operate.action import to_dicts
+from operate.exceptions import SessionLimitException
+from operate.utils.frame_buffer import FrameBuffer
+from operate.utils.input_backend import XTestBackend, create_input_backend
+from operate.utils.operating_system import OperatingSystem
+from operate.utils.screenshot import focused_window_box, grab_screen
+from operate.utils.xvfb import Xvfb
+
+
+class Session:
+    """
+    An execution context for one automation: its own X display, capture,
+    input backend and step history. With `display=None` the session drives
+    the current desktop. `backend` overrides the input backend.
+
+    Only one automation runs in a session at a time, hold `lock` while
+    using it (SessionPool.acquire does).
+    """
+
+    def __init__(self, display=None, xvfb=None, capture_fps=0, history_size=100, backend=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.display = display
+        self.xvfb = xvfb
+        if backend is None and display:
+            backend = XTestBackend(display=display)
+        elif backend is None:
+            backend = create_input_backend()
+        self.operating_system = OperatingSystem(backend, display)
+        self.frame_buffer = None
+        if capture_fps:
+            self.frame_buffer = FrameBuffer(fps=capture_fps, capture=self.grab_screen).start()
+        self.history = deque(maxlen=history_size)
+        self.last_screenshot = None
+        self.last_exchange = None
+        self.last_labels = None
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+    @classmethod
+    def virtual(cls, width=1920, height=1080, **kwargs):
+        """
+        Starts a headless Xvfb display and returns a session bound to it.
+        """
+        xvfb = Xvfb(width, height).start()
+        try:
+            return cls(display=xvfb.display, xvfb=xvfb, **kwargs)
+        except Exception:
+            xvfb.stop()
+            raise
+
+    def grab_screen(self):
+        return grab_screen(self.display)
+
+    def focused_window(self):
+        return focused_window_box(self.display)
+
+    def record_step(self, objective, operations, timeline):
+        self.history.append(
+            {
+                "timestamp": time.time(),
+                "objective": objective,
+                "operations": to_dicts(operations),
+                "executed": timeline.executed_operations,
+                "expected": timeline.total_expected,
+                "actual": timeline.total_actual,
+            }
+        )
+
+    def info(self):
+        return {
+            "sessionId": self.id,
+            "display": self.display,
+            "busy": self.lock.locked(),
+            "steps": len(self.history),
+            "createdAt": self.created_at,
+            "lastUsed": self.last_used,
+        }
+
+    def close(self):
+        if self.frame_buffer:
+            self.frame_buffer.stop()
+            self.frame_buffer = None
+        if self.xvfb:
+            self.xvfb.stop()
+            self.xvfb = None
+            # The display number is reused by the next session, which may
+            # have another size
+            self.operating_system.geometry.invalidate()
+
+
+class SessionPool:
+    """
+    Creates, reuses and reaps sessions, each on its own virtual display so
+    automations can run side by side. Without virtual displays there is a
+    single session on the current desktop.
+
+    Usage:
+        session = pool.acquire()
+        try:
+            ...
+        finally:
+            pool.release(session)
+    """
+
+    def __init__(
+        self,
+        max_sessions=4,
+        idle_timeout=300.0,
+        virtual_displays=True,
+        width=1920,
+        height=1080,
+        capture_fps=0,
+    ):
+        self.max_sessions = max_sessions if virtual_displays else 1
+        self.idle_timeout = idle_timeout
+        self.virtual_displays = virtual_displays
+        self.width = width
+        self.height = height
+        self.capture_fps = capture_fps
+        self._sessions = {}
+        # Sessions being started, counted against max_sessions
+        self._starting = 0
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def _new_session(self):
+        if self.virtual_displays:
+            return Session.virtual(self.width, self.height, capture_fps=self.capture_fps)
+        return Session(capture_fps=self.capture_fps)
+
+    def create(self, acquire=False):
+        """
+        Starts a new session, acquired for the caller when `acquire` is set.
+        """
+        with self._lock:
+            if len(self._sessions) + self._starting >= self.max_sessions:
+                raise SessionLimitException(f"all {self.max_sessions} sessions are in use")
+            self._starting += 1
+        try:
+            session = self._new_session()
+        finally:
+            with self._lock:
+                self._starting -= 1
+        if acquire:
+            session.lock.acquire()
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions[session_id]
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def acquire(self, session_id=None, timeout=-1):
+        """
+        Returns a session with its lock held: the given one, waiting until it
+        is free, otherwise an idle one or a new one.
+        """
+        if session_id is not None:
+            session = self.get(session_id)
+            if not session.lock.acquire(timeout=timeout):
+                raise SessionLimitException(f"session {session_id} is busy")
+            return session
+        with self._lock:
+            for session in self._sessions.values():
+                if session.lock.acquire(blocking=False):
+                    return session
+        return self.create(acquire=True)
+
+    def release(self, session):
+        session.last_used = time.time()
+        session.lock.release()
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id)
+        session.close()
+
+    def reap(self):
+        """
+        Closes sessions that have been idle for longer than idle_timeout.
+        """
+        cutoff = time.time() - self.idle_timeout
+        reaped = []
+        with self._lock:
+            for session in list(self._sessions.values()):
+                if session.last_used < cutoff and session.lock.acquire(blocking=False):
+                    del self._sessions[session.id]
+                    reaped.append(session)
+        for session in reaped:
+            session.close()
+        return reaped
+
+    def _reap_forever(self, interval):
+        while not self._stop.wait(interval):
+            self.reap()
+
+    def start_reaper(self, interval=30.0):
+        if self._reaper is None:
+            self._stop.clear()
+            self._reaper = threading.Thread(
+                target=self._reap_forever, args=(interval,), name="mjak-session-reaper", daemon=True
+            )
+            self._reaper.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+from operate.utils.metrics import ARTIFACT_BYTES, ARTIFACT_EVICTIONS, ARTIFACT_WRITES
+
+INDEX_FILE = "index.jsonl"
+
+
+def image_digest(image):
+    """
+    Content address of an image, a hash of its pixels, so identical frames
+    share one file whatever they were encoded from.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    A size-capped directory of debug images (screenshots, labeled images,
+    OCR boxes), named after their content so identical frames are stored
+    once. When the directory grows over `max_bytes` the least recently used
+    files are evicted.
+
+    Images are encoded and written on a background thread, `put` only hashes
+    them. An image must not be modified after it is put. When more than
+    `max_queue` writes are pending new ones are dropped rather than waited
+    for.
+
+    A small index (the last `index_size` puts, kept in index.jsonl) maps
+    session and step to the stored files, see `find`.
+    """
+
+    def __init__(self, directory="artifacts", max_bytes=256 * 1024 * 1024, max_queue=64, index_size=1000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_size = index_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        # digest -> size in bytes, least recently used first
+        self._files = OrderedDict()
+        self._pending = set()
+        self._bytes = 0
+        self._index = deque(maxlen=index_size)
+        self._index_lines = 0
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.png")
+
+    def _load(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            name, extension = os.path.splitext(entry.name)
+            if extension == ".png" and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(files):
+            self._files[digest] = size
+            self._bytes += size
+        ARTIFACT_BYTES.set(self._bytes)
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as file:
+                for line in file:
+                    self._index_lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("digest") in self._files:
+                        self._index.append(entry)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mjak-artifact-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def put(self, image, kind, session=None, step=None):
+        """
+        Stores `image` and returns its digest, or None when the write queue
+        is full and the image was dropped.
+        """
+        digest = image_digest(image)
+        entry = {"digest": digest, "kind": kind, "session": session, "step": step, "time": time.time()}
+        with self._lock:
+            known = digest in self._files or digest in self._pending
+            if not known:
+                self._pending.add(digest)
+        try:
+            self._queue.put_nowait((entry, None if known else image))
+        except queue.Full:
+            if not known:
+                with self._lock:
+                    self._pending.discard(digest)
+            ARTIFACT_WRITES.inc(outcome="dropped")
+            return None
+        if known:
+            ARTIFACT_WRITES.inc(outcome="deduplicated")
+        self.start()
+        return digest
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                entry, image = item
+                if image is None:
+                    self._touch(entry["digest"])
+                else:
+                    self._write(entry["digest"], image)
+                self._append_index(entry)
+            except Exception as e:
+                print("[ArtifactStore][write] error:", e)
+                ARTIFACT_WRITES.inc(outcome="failed")
+            finally:
+                self._queue.task_done()
+
+    def _touch(self, digest):
+        with self._lock:
+            if digest not in self._files:
+                return
+            self._files.move_to_end(digest)
+        try:
+            os.utime(self._path(digest))
+        except OSError:
+            pass
+
+    def _write(self, digest, image):
+        path = self._path(digest)
+        temporary = f"{path}.tmp"
+        try:
+            image.save(temporary, format="PNG")
+            os.replace(temporary, path)
+            size = os.path.getsize(path)
+        except Exception:
+            with self._lock:
+                self._pending.discard(digest)
+            raise
+        with self._lock:
+            self._pending.discard(digest)
+            self._bytes += size - self._files.get(digest, 0)
+            self._files[digest] = size
+            self._files.move_to_end(digest)
+        ARTIFACT_WRITES.inc(outcome="written")
+        self._evict(keep=digest)
+
+    def _evict(self, keep=None):
+        evicted = []
+        with self._lock:
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                digest, size = next(iter(self._files.items()))
+                if digest == keep:
+                    break
+                del self._files[digest]
+                self._bytes -= size
+                evicted.append(digest)
+            ARTIFACT_BYTES.set(self._bytes)
+        for digest in evicted:
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                pass
+        if evicted:
+            ARTIFACT_EVICTIONS.inc(len(evicted))
+
+    def _append_index(self, entry):
+        with self._lock:
+            if entry["digest"] not in self._files:
+                return
+            self._index.append(entry)
+            rewrite = self._index_lines >= 2 * self.index_size
+            entries = list(self._index) if rewrite else [entry]
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if rewrite:
+            # Compact the index to the entries still kept in memory
+            with open(f"{index_path}.tmp", "w") as file:
+                file.writelines(json.dumps(item) + "\n" for item in entries)
+            os.replace(f"{index_path}.tmp", index_path)
+            self._index_lines = len(entries)
+        else:
+            with open(index_path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+            self._index_lines += 1
+
+    def path(self, digest):
+        """
+        Returns the file of a stored artifact, or None if it was evicted.
+        """
+        with self._lock:
+            if digest not in self._files:
+                return None
+        return self._path(digest)
+
+    def find(self, session=None, step=None, kind=None):
+        """
+        Returns the index entries, oldest first, matching the given session,
+        step and kind, each with the "path" of its file.
+        """
+        with self._lock:
+            entries = [
+                {**entry, "path": self._path(entry["digest"])}
+                for entry in self._index
+                if entry["digest"] in self._files
+                and (session is None or entry["session"] == session)
+                and (step is None or entry["step"] == step)
+                and (kind is None or entry["kind"] == kind)
+            ]
+        return entries
+
+    def flush(self):
+        """
+        Waits until every queued write has been done.
+        """
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store(settings):
+    """
+    Returns the shared ArtifactStore configured from `settings`, or None
+    when artifact_dir is empty.
+    """
+    global _store
+    if not settings.artifact_dir:
+        return None
+    with _store_lock:
+        if _store is None or _store.directory != settings.artifact_dir:
+            if _store is not None:
+                _store.close()
+            _store = ArtifactStore(settings.artifact_dir)
+        _store.max_bytes = int(settings.artifact_max_mb * 1024 * 1024)
+    return _store
+
+
+def close_artifact_store():
+    """
+    Writes out everything still queued and stops the shared store, called
+    at shutdown.
+    """
+    global _store
+    with _store_lock:
+        store, _store = _store, None
+    if store is not None:
+        store.close()
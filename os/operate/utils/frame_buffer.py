@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+
+from operate.utils.screenshot import grab_screen, perceptual_hash
+
+
+class Frame:
+    """
+    A single captured screen frame.
+
+    Attributes:
+        timestamp -- time.time() at which the frame was captured
+        image -- the full resolution PIL image
+        thumbnail -- a downscaled copy, cheap to diff and upload
+        phash -- perceptual hash of the frame (see perceptual_hash)
+    """
+
+    __slots__ = ("timestamp", "image", "thumbnail", "phash")
+
+    def __init__(self, image, thumbnail_width=640, timestamp=None):
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.image = image
+        self.thumbnail = make_thumbnail(image, thumbnail_width)
+        self.phash = perceptual_hash(self.thumbnail)
+
+
+def make_thumbnail(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height))
+
+
+class FrameBuffer:
+    """
+    Captures the screen on a background thread at a fixed rate and keeps the
+    most recent frames in a fixed-size ring buffer, so callers can read the
+    latest screen without waiting on a synchronous capture.
+    """
+
+    def __init__(self, fps=2.0, size=8, thumbnail_width=640, capture=grab_screen):
+        self.interval = 1.0 / fps
+        self.thumbnail_width = thumbnail_width
+        self._capture = capture
+        self._frames = deque(maxlen=size)
+        self._new_frame = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="mjak-frame-buffer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2 + 1)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                image = self._capture()
+                if image is not None:
+                    self.push(Frame(image, self.thumbnail_width, timestamp=started))
+            except Exception as e:
+                print("[FrameBuffer][capture] error:", e)
+            self._stop.wait(max(0.0, self.interval - (time.time() - started)))
+
+    def push(self, frame):
+        with self._new_frame:
+            self._frames.append(frame)
+            self._new_frame.notify_all()
+
+    def latest(self):
+        """
+        Returns the newest frame, or None if nothing has been captured yet.
+        """
+        try:
+            return self._frames[-1]
+        except IndexError:
+            return None
+
+    def frames(self):
+        """
+        Returns a snapshot of the buffered frames, oldest first.
+        """
+        return list(self._frames)
+
+    def frame_before(self, timestamp):
+        """
+        Returns the newest frame captured at or before `timestamp`.
+        """
+        for frame in reversed(self._frames):
+            if frame.timestamp <= timestamp:
+                return frame
+        return None
+
+    def wait_for_frame(self, after, timeout=None):
+        """
+        Blocks until a frame captured after `after` is available and returns
+        it. Returns None on timeout.
+        """
+        if timeout is None:
+            timeout = self.interval * 2 + 1
+        deadline = time.time() + timeout
+        with self._new_frame:
+            while True:
+                frame = self.latest()
+                if frame is not None and frame.timestamp >= after:
+                    return frame
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._new_frame.wait(remaining)
+
+
+_frame_buffer = None
+
+
+def start_frame_buffer(fps=2.0, size=8, thumbnail_width=640):
+    """
+    Starts the process-wide frame buffer, replacing any existing one.
+    """
+    global _frame_buffer
+    stop_frame_buffer()
+    _frame_buffer = FrameBuffer(fps, size, thumbnail_width).start()
+    return _frame_buffer
+
+
+def stop_frame_buffer():
+    global _frame_buffer
+    if _frame_buffer is not None:
+        _frame_buffer.stop()
+        _frame_buffer = None
+
+
+def get_frame_buffer():
+    """
+    Returns the running frame buffer, or None when background capture is off.
+    """
+    return _frame_buffer
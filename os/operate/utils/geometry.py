@@ -0,0 +1,162 @@
+import threading
+import time
+
+# Seconds the input size is trusted before it is queried again, catches a
+# scale (DPI) change that keeps the captured size
+INPUT_SIZE_MAX_AGE = 5.0
+
+
+class ScreenGeometry:
+    """
+    Cached geometry of one display: the size the input backend addresses
+    (logical points, e.g. 1440x900 on a Retina Mac) and the size of the
+    frames captured from it (physical pixels, e.g. 2880x1800), whose ratio
+    is the display's scale factor.
+
+    The model answers in fractions of the captured frame. Every capture
+    path grabs the area whose top-left corner is the input origin (the X
+    root window, the primary monitor on Windows and macOS), so a fraction
+    maps to origin + fraction * input size on any scale factor, and pixel
+    positions found in a frame (labels, OCR boxes, windows) are divided by
+    the scale first.
+
+    The input size is queried again after INPUT_SIZE_MAX_AGE seconds or
+    with a new backend. A captured frame of a different size means the
+    resolution, scale or monitor layout changed, which invalidates the
+    cache, as does a session giving up its display (see Session.close).
+
+    The origin is always (0, 0): moving the primary monitor within the
+    layout without changing its size or scale is not detected, call
+    invalidate() after such a change.
+    """
+
+    def __init__(self, display=None):
+        self.display = display
+        self.origin = (0, 0)
+        self._input_size = None
+        self._queried_at = 0.0
+        self._backend = None
+        self._capture_size = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._input_size = None
+            self._backend = None
+            self._capture_size = None
+
+    def input_size(self, backend):
+        """
+        The size in input coordinates, queried from `backend` on first use
+        and whenever the cached one is older than INPUT_SIZE_MAX_AGE.
+        """
+        size = self._input_size
+        now = time.monotonic()
+        fresh = now - self._queried_at < INPUT_SIZE_MAX_AGE
+        if size is not None and self._backend is backend and fresh:
+            return size
+        size = tuple(backend.size())
+        with self._lock:
+            self._input_size = size
+            self._queried_at = now
+            self._backend = backend
+        return size
+
+    def observe_capture(self, size):
+        """
+        Records the size of a frame captured from this display.
+        """
+        size = tuple(size)
+        if size == self._capture_size:
+            return
+        with self._lock:
+            changed = self._capture_size is not None
+            self._capture_size = size
+            if changed:
+                # The display changed under us, query the input size again
+                self._input_size = None
+                self._backend = None
+
+    @property
+    def capture_size(self):
+        return self._capture_size
+
+    def scale(self, backend):
+        """
+        Physical pixels per input unit (x, y), (1.0, 1.0) until a frame has
+        been captured.
+        """
+        if self._capture_size is None:
+            return 1.0, 1.0
+        width, height = self.input_size(backend)
+        return self._capture_size[0] / width, self._capture_size[1] / height
+
+    def to_input(self, x, y, backend):
+        """
+        Maps screen fractions from the model to input coordinates, clamped
+        to the display.
+        """
+        width, height = self.input_size(backend)
+        x = min(max(float(x), 0.0), 1.0)
+        y = min(max(float(y), 0.0), 1.0)
+        return (
+            self.origin[0] + min(int(width * x), width - 1),
+            self.origin[1] + min(int(height * y), height - 1),
+        )
+
+    def capture_to_fractions(self, x, y, size=None):
+        """
+        Maps a pixel position in a captured frame (of `size`, the last
+        captured size by default) to screen fractions.
+        """
+        width, height = size or self._capture_size
+        return x / width, y / height
+
+
+# Crops smaller than this, or saving less than this share of the frame,
+# are not worth it
+MIN_REGION = 32
+MIN_CROP_SAVING = 0.2
+
+
+def window_region(window, size, margin=0):
+    """
+    Returns the region of a frame of `size` to crop to for the `window` box
+    (see focused_window_box) grown by `margin` pixels, as {"box", "size"},
+    or None when the whole frame should be used.
+    """
+    if window is None:
+        return None
+    width, height = size
+    left, top = max(0, window[0] - margin), max(0, window[1] - margin)
+    right, bottom = min(width, window[2] + margin), min(height, window[3] + margin)
+    if right - left < MIN_REGION or bottom - top < MIN_REGION:
+        return None
+    if (right - left) * (bottom - top) > (1 - MIN_CROP_SAVING) * width * height:
+        return None
+    return {"box": (left, top, right, bottom), "size": (width, height)}
+
+
+def region_to_screen(x, y, region):
+    """
+    Maps fractions of a cropped region back to fractions of the screen.
+    """
+    left, top, right, bottom = region["box"]
+    width, height = region["size"]
+    return (left + x * (right - left)) / width, (top + y * (bottom - top)) / height
+
+
+_geometries = {}
+_geometries_lock = threading.Lock()
+
+
+def screen_geometry(display=None):
+    """
+    Returns the shared ScreenGeometry of an X display (None for the current
+    desktop).
+    """
+    with _geometries_lock:
+        geometry = _geometries.get(display)
+        if geometry is None:
+            geometry = _geometries[display] = ScreenGeometry(display)
+        return geometry
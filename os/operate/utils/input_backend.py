@@ -0,0 +1,233 @@
+import os
+import time
+from collections import namedtuple
+
+
+class InputBackend:
+    """
+    Interface between OperatingSystem and whatever actually delivers the
+    keyboard and mouse events.
+    """
+
+    name = None
+
+    def size(self):
+        raise NotImplementedError
+
+    def key_down(self, key):
+        raise NotImplementedError
+
+    def key_up(self, key):
+        raise NotImplementedError
+
+    def write(self, char):
+        raise NotImplementedError
+
+    def move_to(self, x, y, duration=0.0):
+        raise NotImplementedError
+
+    def click(self, x, y):
+        raise NotImplementedError
+
+
+class PyAutoGUIBackend(InputBackend):
+    """
+    Drives the real desktop through pyautogui.
+    """
+
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+
+        self._pyautogui = pyautogui
+
+    def size(self):
+        return tuple(self._pyautogui.size())
+
+    def key_down(self, key):
+        self._pyautogui.keyDown(key)
+
+    def key_up(self, key):
+        self._pyautogui.keyUp(key)
+
+    def write(self, char):
+        self._pyautogui.write(char)
+
+    def move_to(self, x, y, duration=0.0):
+        self._pyautogui.moveTo(x, y, duration=duration)
+
+    def click(self, x, y):
+        self._pyautogui.click(x, y)
+
+
+class XTestBackend(InputBackend):
+    """
+    Injects events with the XTest extension, works against any X display
+    including a headless Xvfb one.
+    """
+
+    name = "xtest"
+
+    # pyautogui key names to X keysym names
+    KEYSYMS = {
+        "enter": "Return",
+        "return": "Return",
+        "esc": "Escape",
+        "escape": "Escape",
+        "tab": "Tab",
+        "space": "space",
+        "backspace": "BackSpace",
+        "delete": "Delete",
+        "del": "Delete",
+        "up": "Up",
+        "down": "Down",
+        "left": "Left",
+        "right": "Right",
+        "home": "Home",
+        "end": "End",
+        "pageup": "Prior",
+        "pagedown": "Next",
+        "ctrl": "Control_L",
+        "control": "Control_L",
+        "shift": "Shift_L",
+        "alt": "Alt_L",
+        "option": "Alt_L",
+        "win": "Super_L",
+        "command": "Super_L",
+        "cmd": "Super_L",
+        "\n": "Return",
+        "\t": "Tab",
+    }
+
+    def __init__(self, display=None):
+        import Xlib.display
+        import Xlib.X
+        import Xlib.XK
+        from Xlib.ext import xtest
+
+        self._X = Xlib.X
+        self._XK = Xlib.XK
+        self._xtest = xtest
+        self._display = Xlib.display.Display(display)
+        self._shift = self._keycode("shift")
+
+    def _keysym(self, key):
+        name = self.KEYSYMS.get(key.lower() if len(key) > 1 else key, key)
+        keysym = self._XK.string_to_keysym(name)
+        if keysym == 0 and len(name) == 1:
+            # Latin-1 characters map to keysyms with the same code point
+            keysym = ord(name)
+        return keysym
+
+    def _keycode(self, key):
+        keycode = self._display.keysym_to_keycode(self._keysym(key))
+        if not keycode:
+            raise ValueError(f"No keycode for key {key!r}")
+        return keycode
+
+    def _fake(self, event_type, detail=0, **kwargs):
+        self._xtest.fake_input(self._display, event_type, detail, **kwargs)
+        self._display.sync()
+
+    def size(self):
+        screen = self._display.screen()
+        return screen.width_in_pixels, screen.height_in_pixels
+
+    def key_down(self, key):
+        self._fake(self._X.KeyPress, self._keycode(key))
+
+    def key_up(self, key):
+        self._fake(self._X.KeyRelease, self._keycode(key))
+
+    def write(self, char):
+        keysym = self._keysym(char)
+        keycode = self._keycode(char)
+        # Characters that are not on the unshifted level need shift held
+        shifted = self._display.keycode_to_keysym(keycode, 0) != keysym
+        if shifted:
+            self._fake(self._X.KeyPress, self._shift)
+        self._fake(self._X.KeyPress, keycode)
+        self._fake(self._X.KeyRelease, keycode)
+        if shifted:
+            self._fake(self._X.KeyRelease, self._shift)
+
+    def move_to(self, x, y, duration=0.0):
+        # XTest moves are instant, wait out the duration like pyautogui does
+        self._fake(self._X.MotionNotify, x=int(x), y=int(y))
+        if duration:
+            time.sleep(duration)
+
+    def click(self, x, y):
+        self.move_to(x, y)
+        self._fake(self._X.ButtonPress, 1)
+        self._fake(self._X.ButtonRelease, 1)
+
+
+InputEvent = namedtuple("InputEvent", ["timestamp", "kind", "args"])
+
+
+class RecordingBackend(InputBackend):
+    """
+    Records every event in memory with a time.perf_counter() timestamp
+    instead of delivering it. Used to benchmark the executor without a
+    desktop.
+
+    With simulate_durations the mouse moves take as long as they would on a
+    real display, otherwise every event is instant.
+    """
+
+    name = "recording"
+
+    def __init__(self, size=(1920, 1080), simulate_durations=True):
+        self._size = tuple(size)
+        self.simulate_durations = simulate_durations
+        self.events = []
+
+    def _record(self, kind, *args):
+        self.events.append(InputEvent(time.perf_counter(), kind, args))
+
+    def clear(self):
+        self.events = []
+
+    def size(self):
+        return self._size
+
+    def key_down(self, key):
+        self._record("key_down", key)
+
+    def key_up(self, key):
+        self._record("key_up", key)
+
+    def write(self, char):
+        self._record("write", char)
+
+    def move_to(self, x, y, duration=0.0):
+        self._record("move_to", x, y)
+        if duration and self.simulate_durations:
+            time.sleep(duration)
+
+    def click(self, x, y):
+        self._record("click", x, y)
+
+
+INPUT_BACKENDS = {
+    PyAutoGUIBackend.name: PyAutoGUIBackend,
+    XTestBackend.name: XTestBackend,
+    RecordingBackend.name: RecordingBackend,
+}
+
+
+def create_input_backend(name=None, **kwargs):
+    """
+    Creates an input backend by name. Defaults to MJAK_INPUT_BACKEND, or
+    pyautogui when that is not set.
+    """
+    name = name or os.getenv("MJAK_INPUT_BACKEND") or PyAutoGUIBackend.name
+    try:
+        backend_class = INPUT_BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown input backend {name!r}, expected one of {sorted(INPUT_BACKENDS)}"
+        )
+    return backend_class(**kwargs)
@@ -1,10 +1,20 @@
 import io
 import base64
-import json
-import os
-import time
-import asyncio
-from PIL import Image, ImageDraw
+import threading
+from collections import OrderedDict
+
+from operate.config import Config
+from operate.utils.artifacts import get_artifact_store, image_digest
+from operate.utils.geometry import region_to_screen
+
+# Load configuration
+config = Config()
+
+# Frames labeled recently, by content, so an unchanged screen is not run
+# through YOLO again
+LABEL_CACHE_SIZE = 8
+_label_cache = OrderedDict()
+_label_cache_lock = threading.Lock()
 
 
 def validate_and_extract_image_data(data):
@@ -52,13 +62,46 @@ def is_overlapping(box1, box2):
     return True
 
 
-def add_labels(base64_data, yolo_model):
+def add_labels(base64_data, yolo_model, session_id=None, step=None):
+    """
+    Labels a base64 encoded screenshot, see label_image. Returns the
+    labeled image as base64 PNG and the box of each label.
+    """
+    from PIL import Image
+
     image_bytes = base64.b64decode(base64_data)
-    image_labeled = Image.open(io.BytesIO(image_bytes))  # Corrected this line
-    image_debug = image_labeled.copy()  # Create a copy for the debug image
-    image_original = (
-        image_labeled.copy()
-    )  # Copy of the original image for base64 return
+    image_labeled, label_coordinates = label_image(
+        Image.open(io.BytesIO(image_bytes)), yolo_model, session_id, step
+    )
+
+    # Convert image to base64 for return
+    buffered_labeled = io.BytesIO()
+    image_labeled.save(buffered_labeled, format="PNG")  # I guess this is needed
+    img_base64_labeled = base64.b64encode(buffered_labeled.getvalue()).decode("utf-8")
+
+    return img_base64_labeled, label_coordinates
+
+
+def label_image(image, yolo_model, session_id=None, step=None):
+    """
+    Draws a numbered box ("~0", "~1", ...) around every button the YOLO
+    model detects. Returns the labeled image and the box of each label in
+    pixels of `image`. The original, labeled and debug images go to the
+    artifact store, indexed by `session_id` and `step`. Results are cached
+    by frame content, the returned image must not be modified.
+    """
+    from PIL import ImageDraw
+
+    digest = image_digest(image)
+    with _label_cache_lock:
+        cached = _label_cache.get(digest)
+        if cached is not None:
+            _label_cache.move_to_end(digest)
+            return cached
+
+    image_labeled = image.copy()
+    image_debug = image.copy()  # Create a copy for the debug image
+    image_original = image
 
     results = yolo_model(image_labeled)
 
@@ -68,12 +111,8 @@ def add_labels(base64_data, yolo_model):
     )  # Create a separate draw object for the debug image
     font_size = 45
 
-    labeled_images_dir = "labeled_images"
     label_coordinates = {}  # Dictionary to store coordinates
 
-    if not os.path.exists(labeled_images_dir):
-        os.makedirs(labeled_images_dir)
-
     counter = 0
     drawn_boxes = []  # List to keep track of boxes already drawn
     for result in results:
@@ -113,29 +152,41 @@ def add_labels(base64_data, yolo_model):
 
                     counter += 1
 
-    # Save the image
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    # Written in the background, identical screens are stored once
+    store = get_artifact_store(config.settings)
+    if store is not None:
+        store.put(image_original, "original", session_id, step)
+        store.put(image_labeled, "labeled", session_id, step)
+        store.put(image_debug, "debug", session_id, step)
 
-    output_path = os.path.join(labeled_images_dir, f"img_{timestamp}_labeled.png")
-    output_path_debug = os.path.join(labeled_images_dir, f"img_{timestamp}_debug.png")
-    output_path_original = os.path.join(
-        labeled_images_dir, f"img_{timestamp}_original.png"
-    )
+    with _label_cache_lock:
+        _label_cache[digest] = image_labeled, label_coordinates
+        while len(_label_cache) > LABEL_CACHE_SIZE:
+            _label_cache.popitem(last=False)
+    return image_labeled, label_coordinates
 
-    image_labeled.save(output_path)
-    image_debug.save(output_path_debug)
-    image_original.save(output_path_original)
 
-    buffered_original = io.BytesIO()
-    image_original.save(buffered_original, format="PNG")  # I guess this is needed
-    img_base64_original = base64.b64encode(buffered_original.getvalue()).decode("utf-8")
+def normalize_label(label):
+    """
+    Returns a label ID in the "~3" form, models sometimes drop the tilde.
+    """
+    label = str(label).strip()
+    return label if label.startswith("~") else f"~{label}"
 
-    # Convert image to base64 for return
-    buffered_labeled = io.BytesIO()
-    image_labeled.save(buffered_labeled, format="PNG")  # I guess this is needed
-    img_base64_labeled = base64.b64encode(buffered_labeled.getvalue()).decode("utf-8")
 
-    return img_base64_labeled, label_coordinates
+def label_position(label, labels):
+    """
+    Resolves a label to the center of its box as screen fractions, with
+    `labels` being {"coordinates": label_coordinates, "size": image size}
+    of the labeled frame, and "region" when it was cropped (see
+    window_region). Returns None for an unknown label.
+    """
+    position = get_click_position_in_percent(
+        get_label_coordinates(label, labels["coordinates"]), labels["size"]
+    )
+    if position is not None and labels.get("region"):
+        position = region_to_screen(*position, labels["region"])
+    return position
 
 
 def get_click_position_in_percent(coordinates, image_size):
@@ -0,0 +1,232 @@
+import threading
+from contextlib import contextmanager
+
+from operate.utils.timing import timings
+
+# Seconds, covers everything from a JSON parse to a slow model call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+
+    def _render_value(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value["counts"]):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(value['sum'])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_metrics():
+    """
+    Renders every registered metric in the Prometheus text format.
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_DURATION = Histogram(
+    "mjak_stage_duration_seconds",
+    "Duration of the agent loop stages (capture, encode, model, parse, execute, step).",
+    ["stage"],
+)
+OPERATION_DURATION = Histogram(
+    "mjak_operation_duration_seconds",
+    "Duration of executed operations by type.",
+    ["operation"],
+)
+PARSE_FAILURES = Counter(
+    "mjak_parse_failures_total",
+    "Model responses that could not be parsed as JSON.",
+)
+MODEL_ERRORS = Counter(
+    "mjak_model_errors_total",
+    "Model calls that failed.",
+)
+MODEL_RETRIES = Counter(
+    "mjak_model_retries_total",
+    "Model call attempts retried after a retryable error.",
+)
+MODEL_HEDGES = Counter(
+    "mjak_model_hedges_total",
+    "Duplicate model calls started because the first one was slow.",
+)
+MODEL_HEDGE_WINS = Counter(
+    "mjak_model_hedge_wins_total",
+    "Hedged model calls that finished before the original.",
+)
+MODEL_DEADLINES_EXCEEDED = Counter(
+    "mjak_model_deadlines_exceeded_total",
+    "Model calls that got no response within their deadline.",
+)
+MODEL_QUEUE_DEPTH = Gauge(
+    "mjak_model_queue_depth",
+    "Model calls waiting for the rate limiter or a free slot.",
+)
+MODEL_CALLS_IN_FLIGHT = Gauge(
+    "mjak_model_calls_in_flight",
+    "Model calls currently sent upstream.",
+)
+MODEL_SHED = Counter(
+    "mjak_model_shed_total",
+    "Model calls rejected because the queue was full or the wait too long.",
+    ["reason"],
+)
+PREFETCHES = Counter(
+    "mjak_prefetches_total",
+    "Speculative next-step model calls by outcome (hit, stale, error).",
+    ["outcome"],
+)
+LOCAL_PLANS = Counter(
+    "mjak_local_plans_total",
+    "Objectives planned locally (hit) or sent to the model (miss).",
+    ["outcome"],
+)
+ACTION_VERIFICATIONS = Counter(
+    "mjak_action_verifications_total",
+    "Executed operations by whether the screen visibly changed (changed, unchanged, unknown).",
+    ["operation", "outcome"],
+)
+ACTION_RETRIES = Counter(
+    "mjak_action_retries_total",
+    "Clicks retried because the screen did not change.",
+)
+ARTIFACT_WRITES = Counter(
+    "mjak_artifact_writes_total",
+    "Debug images put in the artifact store by outcome (written, deduplicated, dropped, failed).",
+    ["outcome"],
+)
+ARTIFACT_EVICTIONS = Counter(
+    "mjak_artifact_evictions_total",
+    "Artifacts evicted to keep the store under its size cap.",
+)
+ARTIFACT_BYTES = Gauge(
+    "mjak_artifact_bytes",
+    "Size of the artifact store on disk.",
+)
+JOBS_IN_FLIGHT = Gauge(
+    "mjak_jobs_in_flight",
+    "Requests currently being processed by the API server.",
+    ["endpoint"],
+)
+
+
+def _observe_span(name, duration):
+    if name.startswith("operation."):
+        OPERATION_DURATION.observe(duration, operation=name[len("operation."):])
+    else:
+        STAGE_DURATION.observe(duration, stage=name)
+
+
+timings.add_listener(_observe_span)
@@ -1,7 +1,5 @@
 from operate.config import Config
-from PIL import Image, ImageDraw
-import os
-from datetime import datetime
+from operate.utils.artifacts import get_artifact_store
 
 # Load configuration
 config = Config()
@@ -24,10 +22,7 @@ def get_text_element(result, search_text, image_path):
     if config.verbose:
         print("[get_text_element]")
         print("[get_text_element] search_text", search_text)
-        # Create /ocr directory if it doesn't exist
-        ocr_dir = "ocr"
-        if not os.path.exists(ocr_dir):
-            os.makedirs(ocr_dir)
+        from PIL import Image, ImageDraw
 
         # Open the original image
         image = Image.open(image_path)
@@ -52,11 +47,11 @@ def get_text_element(result, search_text, image_path):
             # Draw bounding box of the found text in red
             box = result[found_index][0]
             draw.polygon([tuple(point) for point in box], outline="red")
-            # Save the image with bounding boxes
-            datetime_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-            ocr_image_path = os.path.join(ocr_dir, f"ocr_image_{datetime_str}.png")
-            image.save(ocr_image_path)
-            print("[get_text_element] OCR image saved at:", ocr_image_path)
+            # Store the image with bounding boxes
+            store = get_artifact_store(config.settings)
+            if store is not None:
+                digest = store.put(image, "ocr")
+                print("[get_text_element] OCR image stored as:", digest)
 
         return found_index
 
@@ -89,6 +84,8 @@ def get_text_coordinates(result, index, image_path):
     center_x = (min_x + max_x) / 2
     center_y = (min_y + max_y) / 2
 
+    from PIL import Image
+
     # Get image dimensions
     with Image.open(image_path) as img:
         width, height = img.size
@@ -1,27 +1,55 @@
-import pyautogui
-import platform
 import time
 import math
 
+from operate.config import Config
 from operate.utils.misc import convert_percent_to_decimal
+from operate.utils.input_backend import create_input_backend
+from operate.utils.geometry import screen_geometry
+
+config = Config()
 
 
 class OperatingSystem:
-    def write(self, content):
+    def __init__(self, backend=None, display=None):
+        self._backend = backend
+        # Screen size is cached there, clicks make no size queries
+        self.geometry = screen_geometry(display)
+
+    @property
+    def backend(self):
+        # Created on first use so the default backend is only imported when
+        # something is actually executed
+        if self._backend is None:
+            self._backend = create_input_backend()
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    def write(self, content, cancelled=None):
+        """
+        Types `content` one character at a time, stopping early once the
+        `cancelled` event is set.
+        """
         try:
             content = content.replace("\\n", "\n")
             for char in content:
-                pyautogui.write(char)
+                if cancelled is not None and cancelled.is_set():
+                    break
+                self.backend.write(char)
         except Exception as e:
             print("[OperatingSystem][write] error:", e)
 
     def press(self, keys):
         try:
             for key in keys:
-                pyautogui.keyDown(key)
-            time.sleep(0.1)
+                self.backend.key_down(key)
+            key_hold = config.settings.key_hold
+            if key_hold:
+                time.sleep(key_hold)
             for key in keys:
-                pyautogui.keyUp(key)
+                self.backend.key_up(key)
         except Exception as e:
             print("[OperatingSystem][press] error:", e)
 
@@ -40,24 +68,32 @@ class OperatingSystem:
         self,
         x_percentage,
         y_percentage,
-        duration=0.2,
-        circle_radius=50,
-        circle_duration=0.5,
+        duration=None,
+        circle_radius=None,
+        circle_duration=None,
     ):
+        settings = config.settings
+        if duration is None:
+            duration = settings.click_move_duration
+        if circle_radius is None:
+            circle_radius = settings.click_circle_radius
+        if circle_duration is None:
+            circle_duration = settings.click_circle_duration
         try:
-            screen_width, screen_height = pyautogui.size()
-            x_pixel = int(screen_width * float(x_percentage))
-            y_pixel = int(screen_height * float(y_percentage))
+            x_pixel, y_pixel = self.geometry.to_input(x_percentage, y_percentage, self.backend)
 
-            pyautogui.moveTo(x_pixel, y_pixel, duration=duration)
+            self.backend.move_to(x_pixel, y_pixel, duration=duration)
 
-            start_time = time.time()
-            while time.time() - start_time < circle_duration:
-                angle = ((time.time() - start_time) / circle_duration) * 2 * math.pi
+            # A fixed number of animation steps keeps the event count the
+            # same across backends, each pyautogui move takes about 0.2s
+            # including its pause
+            steps = max(1, int(circle_duration / 0.2))
+            for step in range(steps):
+                angle = (step / steps) * 2 * math.pi
                 x = x_pixel + math.cos(angle) * circle_radius
                 y = y_pixel + math.sin(angle) * circle_radius
-                pyautogui.moveTo(x, y, duration=0.1)
+                self.backend.move_to(x, y, duration=0.1)
 
-            pyautogui.click(x_pixel, y_pixel)
+            self.backend.click(x_pixel, y_pixel)
         except Exception as e:
             print("[OperatingSystem][click_at_percentage] error:", e)
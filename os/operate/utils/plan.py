@@ -0,0 +1,177 @@
+import time
+
+from operate.action import Action, Op
+
+# Seconds to wait after an operation that is expected to change the UI
+SETTLE_DELAY = 1.0
+
+# Rough per-operation costs, pyautogui pauses 0.1s after every call
+PYAUTOGUI_PAUSE = 0.1
+CLICK_DURATION = 0.2 + 0.5 + PYAUTOGUI_PAUSE
+
+MODIFIER_KEYS = {"ctrl", "control", "shift", "alt", "option", "command", "cmd"}
+TRANSITION_KEYS = {"enter", "return"}
+
+# Shortcuts that focus the address bar, pressing them twice in a row has the
+# same effect as pressing them once. Not f6 (cycles panes) nor the launcher
+# shortcuts (toggle it open and closed)
+FOCUS_SHORTCUTS = {("ctrl", "l"), ("command", "l"), ("alt", "d")}
+LAUNCHER_SHORTCUTS = {("win",), ("command", "space")}
+
+
+PRESS_OPS = (Op.PRESS, Op.HOTKEY)
+
+
+def _keys(action):
+    return tuple(key.lower() for key in action.keys)
+
+
+def is_noop(action):
+    op = action.op
+    if op is Op.WRITE:
+        return not action.content
+    if op in PRESS_OPS:
+        keys = _keys(action)
+        # Pressing and releasing bare modifiers does nothing
+        return not keys or all(key in MODIFIER_KEYS for key in keys)
+    if op is Op.WAIT:
+        return not action.seconds
+    return False
+
+
+def expects_transition(operation):
+    """
+    Returns True if the UI is expected to change after this operation, in
+    which case the next operation has to wait for it to settle.
+    """
+    op = operation.op
+    if op is Op.CLICK:
+        return True
+    if op in PRESS_OPS:
+        keys = _keys(operation)
+        return bool(TRANSITION_KEYS.intersection(keys)) or keys in LAUNCHER_SHORTCUTS
+    return False
+
+
+def compile_plan(operations, settle_delay=SETTLE_DELAY):
+    """
+    Rewrites the Actions emitted by the model into an equivalent but
+    cheaper plan:
+
+    - drops no-ops and anything after `done`
+    - merges consecutive `write` operations
+    - collapses repeated focus shortcuts
+    - inserts `wait` operations only after expected UI transitions
+
+    Returns a new list, the input is left untouched.
+    """
+    compiled = []
+    for operation in operations:
+        if is_noop(operation):
+            continue
+        op = operation.op
+        previous = compiled[-1] if compiled else None
+        previous_op = previous.op if previous else None
+
+        if op is Op.WRITE and previous_op is Op.WRITE:
+            thoughts = [t for t in (previous.thought, operation.thought) if t]
+            compiled[-1] = previous.replace(
+                content=previous.content + operation.content,
+                thought=" ".join(thoughts),
+            )
+            continue
+
+        if (
+            op in PRESS_OPS
+            and previous_op in PRESS_OPS
+            and _keys(operation) == _keys(previous)
+            and _keys(operation) in FOCUS_SHORTCUTS
+        ):
+            continue
+
+        # Actions are only read from here on, no need to copy them
+        compiled.append(operation)
+        if op is Op.DONE:
+            break
+
+    plan = []
+    for index, operation in enumerate(compiled):
+        plan.append(operation)
+        following = compiled[index + 1] if index + 1 < len(compiled) else None
+        # A trailing wait is pointless, the caller captures the screen next
+        if (
+            following is not None
+            and following.op is not Op.DONE
+            and expects_transition(operation)
+        ):
+            plan.append(Action(Op.WAIT, seconds=settle_delay))
+    return plan
+
+
+def expected_duration(operation):
+    """
+    Estimates how long an operation should take to execute, in seconds.
+    """
+    op = operation.op
+    if op is Op.WRITE:
+        return len(operation.content.replace("\\n", "\n")) * PYAUTOGUI_PAUSE
+    if op in PRESS_OPS:
+        return len(operation.keys) * 2 * PYAUTOGUI_PAUSE + 0.1
+    if op is Op.CLICK:
+        return CLICK_DURATION
+    if op is Op.WAIT:
+        return operation.seconds
+    return 0.0
+
+
+class ExecutionTimeline:
+    """
+    Records the expected and actual duration of every executed operation.
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def record(self, operation, expected, actual, verification=None):
+        """
+        `verification` is the result of ActionVerifier.check for operations
+        that were checked, the entry's "changed" is None otherwise.
+        """
+        self.entries.append(
+            {
+                "operation": operation.op.value,
+                "expected": expected,
+                "actual": actual,
+                "started": time.time() - actual,
+                "changed": verification["changed"] if verification else None,
+                "retries": verification.get("retries", 0) if verification else 0,
+            }
+        )
+
+    @property
+    def executed_operations(self):
+        return sum(1 for entry in self.entries if entry["operation"] != "wait")
+
+    @property
+    def total_expected(self):
+        return sum(entry["expected"] for entry in self.entries)
+
+    @property
+    def total_actual(self):
+        return sum(entry["actual"] for entry in self.entries)
+
+    @property
+    def unchanged_operations(self):
+        return sum(1 for entry in self.entries if entry["changed"] is False)
+
+    def summary(self):
+        lines = [f"{'#':>3}  {'operation':<10} {'expected':>9} {'actual':>9}  changed"]
+        for index, entry in enumerate(self.entries):
+            changed = {True: "yes", False: "no", None: "-"}[entry["changed"]]
+            lines.append(
+                f"{index:>3}  {entry['operation']:<10} {entry['expected']:>8.2f}s {entry['actual']:>8.2f}s  {changed}"
+            )
+        lines.append(
+            f"{'':>3}  {'total':<10} {self.total_expected:>8.2f}s {self.total_actual:>8.2f}s"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from operate.exceptions import StageTimeoutException
+
+# Slack on top of the configured timeouts of a stage, they bound the work
+# done in it (a frame buffer wait, a model call) but not the handoff to and
+# from its thread
+STAGE_GRACE = 1.0
+
+
+def _settle(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def in_thread(function, *args, **kwargs):
+    """
+    Runs `function` on a daemon thread and returns an asyncio future of its
+    result. Unlike asyncio.to_thread the thread is not joined when the loop
+    shuts down, so a stage given up on (a model call in flight) does not
+    hold up Ctrl-C. Cancelling the future does not stop the thread.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            result, error = context.run(function, *args, **kwargs), None
+        except BaseException as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_settle, future, result, error)
+        except RuntimeError:
+            # The loop is closed, nobody is waiting any more
+            pass
+
+    threading.Thread(target=run, name="mjak-stage", daemon=True).start()
+    return future
+
+
+def time_left(deadline):
+    """
+    Seconds until a time.monotonic() `deadline`, None when there is none.
+    """
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+async def run_stage(name, awaitable, timeout=None, deadline=None):
+    """
+    Awaits a stage of the agent loop for at most `timeout` seconds (None
+    or 0 for no limit) and no later than `deadline`. Raises
+    StageTimeoutException when it takes longer.
+    """
+    limit = timeout or None
+    remaining = time_left(deadline)
+    if remaining is not None and (limit is None or remaining < limit):
+        limit = remaining
+    try:
+        return await asyncio.wait_for(awaitable, limit)
+    except asyncio.TimeoutError:
+        raise StageTimeoutException(name, limit)
@@ -1,24 +1,77 @@
+import io
 import os
 import platform
 import subprocess
-import pyautogui
-from PIL import Image, ImageDraw, ImageGrab
-import Xlib.display
-import Xlib.X
-import Xlib.Xutil  # not sure if Xutil is necessary
+import tempfile
+
+# pyautogui, PIL and Xlib are imported where they are used, they are slow to
+# import and not needed to start the CLI
+
+
+def _grab_linux(display=None):
+    import Xlib.display
+    from PIL import ImageGrab
+
+    # Use xlib to prevent scrot dependency for Linux
+    connection = Xlib.display.Display(display)
+    try:
+        screen = connection.screen()
+        size = screen.width_in_pixels, screen.height_in_pixels
+    finally:
+        connection.close()
+    return ImageGrab.grab(bbox=(0, 0, size[0], size[1]), xdisplay=display)
+
+
+def focused_window_box(display=None):
+    """
+    Returns the focused top-level window as (left, top, right, bottom) in
+    root window pixels, or None when it cannot be found (not on Linux, no
+    window manager, nothing focused).
+    """
+    if platform.system() != "Linux":
+        return None
+    import Xlib.display
+    import Xlib.X
+
+    try:
+        connection = Xlib.display.Display(display)
+    except Exception:
+        return None
+    try:
+        root = connection.screen().root
+        window = None
+        # Window managers publish the active window, the input focus can be
+        # a child of it
+        active = root.get_full_property(
+            connection.intern_atom("_NET_ACTIVE_WINDOW"), Xlib.X.AnyPropertyType
+        )
+        if active is not None and len(active.value) and active.value[0]:
+            window = connection.create_resource_object("window", active.value[0])
+        else:
+            focus = connection.get_input_focus().focus
+            if not isinstance(focus, int) and focus != root:
+                window = focus
+        if window is None:
+            return None
+        geometry = window.get_geometry()
+        origin = root.translate_coords(window, 0, 0)
+        return origin.x, origin.y, origin.x + geometry.width, origin.y + geometry.height
+    except Exception:
+        return None
+    finally:
+        connection.close()
 
 
 def capture_screen_with_cursor(file_path):
     user_platform = platform.system()
 
     if user_platform == "Windows":
+        import pyautogui
+
         screenshot = pyautogui.screenshot()
         screenshot.save(file_path)
     elif user_platform == "Linux":
-        # Use xlib to prevent scrot dependency for Linux
-        screen = Xlib.display.Display().screen()
-        size = screen.width_in_pixels, screen.height_in_pixels
-        screenshot = ImageGrab.grab(bbox=(0, 0, size[0], size[1]))
+        screenshot = _grab_linux()
         screenshot.save(file_path)
     elif user_platform == "Darwin":  # (Mac OS)
         # Use the screencapture utility to capture the screen with the cursor
@@ -27,7 +80,81 @@ def capture_screen_with_cursor(file_path):
         print(f"The platform you're using ({user_platform}) is not currently supported")
 
 
+def grab_screen(display=None):
+    """
+    Captures the screen into memory and returns it as a PIL image, or None if
+    the platform is not supported. On Linux `display` selects the X display
+    (e.g. ":1"), the default one otherwise.
+    """
+    user_platform = platform.system()
+
+    if user_platform == "Windows":
+        import pyautogui
+
+        return pyautogui.screenshot()
+    elif user_platform == "Linux":
+        return _grab_linux(display)
+    elif user_platform == "Darwin":
+        from PIL import Image
+
+        # screencapture can only write to a file, so round-trip through a temp file
+        fd, file_path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        try:
+            subprocess.run(["screencapture", "-C", file_path])
+            with Image.open(file_path) as img:
+                img.load()
+                return img.copy()
+        finally:
+            os.remove(file_path)
+    print(f"The platform you're using ({user_platform}) is not currently supported")
+    return None
+
+
+def encode_image(image, image_format="PNG", quality=85, max_width=0):
+    """
+    Encodes a PIL image into an inline blob that can be sent to the model,
+    downscaled to max_width when it is wider (0 keeps the size).
+    """
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height))
+    image_format = image_format.upper()
+    if image_format == "JPG":
+        image_format = "JPEG"
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        image.convert("RGB").save(buffer, format=image_format, quality=quality)
+    else:
+        image.save(buffer, format=image_format)
+    return {"mime_type": f"image/{image_format.lower()}", "data": buffer.getvalue()}
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    Computes a 64-bit difference hash (dHash) of an image. Visually similar
+    frames produce hashes with a small Hamming distance.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size))
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hash_distance(hash_a, hash_b):
+    """
+    Returns the Hamming distance between two perceptual hashes.
+    """
+    return bin(hash_a ^ hash_b).count("1")
+
+
 def compress_screenshot(raw_screenshot_filename, screenshot_filename):
+    from PIL import Image
+
     with Image.open(raw_screenshot_filename) as img:
         # Check if the image has an alpha channel (transparency)
         if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
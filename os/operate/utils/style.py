@@ -1,18 +1,25 @@
 import sys
 import platform
 import os
-from prompt_toolkit.styles import Style as PromptStyle
 
+STYLE = {
+    "dialog": "bg:#88ff88",
+    "button": "bg:#ffffff #000000",
+    "dialog.body": "bg:#44cc44 #ffffff",
+    "dialog shadow": "bg:#003800",
+}
 
-# Define style
-style = PromptStyle.from_dict(
-    {
-        "dialog": "bg:#88ff88",
-        "button": "bg:#ffffff #000000",
-        "dialog.body": "bg:#44cc44 #ffffff",
-        "dialog shadow": "bg:#003800",
-    }
-)
+
+def __getattr__(name):
+    # The prompt_toolkit style is only built when a dialog needs it, so
+    # importing the ANSI codes stays cheap
+    if name == "style":
+        from prompt_toolkit.styles import Style as PromptStyle
+
+        global style
+        style = PromptStyle.from_dict(STYLE)
+        return style
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Check if on a windows terminal that supports ANSI escape codes
@@ -27,10 +34,11 @@ def supports_ansi():
 
 
 # Define ANSI color codes
-ANSI_GREEN = "\033[32m" if supports_ansi() else ""  # Standard green text
-ANSI_BRIGHT_GREEN = "\033[92m" if supports_ansi() else ""  # Bright/bold green text
-ANSI_RESET = "\033[0m" if supports_ansi() else ""  # Reset to default text color
-ANSI_BLUE = "\033[94m" if supports_ansi() else ""  # Bright blue
-ANSI_YELLOW = "\033[33m" if supports_ansi() else ""  # Standard yellow text
-ANSI_RED = "\033[31m" if supports_ansi() else ""
-ANSI_BRIGHT_MAGENTA = "\033[95m" if supports_ansi() else ""  # Bright magenta text
+_ANSI = supports_ansi()
+ANSI_GREEN = "\033[32m" if _ANSI else ""  # Standard green text
+ANSI_BRIGHT_GREEN = "\033[92m" if _ANSI else ""  # Bright/bold green text
+ANSI_RESET = "\033[0m" if _ANSI else ""  # Reset to default text color
+ANSI_BLUE = "\033[94m" if _ANSI else ""  # Bright blue
+ANSI_YELLOW = "\033[33m" if _ANSI else ""  # Standard yellow text
+ANSI_RED = "\033[31m" if _ANSI else ""
+ANSI_BRIGHT_MAGENTA = "\033[95m" if _ANSI else ""  # Bright magenta text
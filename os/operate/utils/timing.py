@@ -0,0 +1,109 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Samples kept per span, the oldest are dropped so a long-running server
+# does not grow without bound
+MAX_SAMPLES = 10000
+
+
+class Timings:
+    """
+    Collects the duration of named spans (e.g. "capture", "model") so the
+    agent loop can be profiled per stage. Only the last `max_samples`
+    durations of each span are kept.
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._listeners = []
+
+    def record(self, name, duration):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.max_samples)
+            self._samples[name].append(duration)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(name, duration)
+
+    def add_listener(self, listener):
+        """
+        Registers a callable invoked as listener(name, duration) for every
+        recorded span.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def samples(self, name):
+        with self._lock:
+            return list(self._samples.get(name, []))
+
+    def names(self):
+        with self._lock:
+            return list(self._samples)
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+    def summary(self):
+        """
+        Returns {name: {count, total, mean, p50, p95, p99}} for every span,
+        over the samples still kept.
+        """
+        result = {}
+        for name in self.names():
+            values = self.samples(name)
+            result[name] = {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+        return result
+
+
+def format_summary(summary):
+    """
+    Formats Timings.summary() as a table for the terminal.
+    """
+    lines = [f"{'span':<18} {'count':>6} {'total':>9} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}"]
+    for name, row in sorted(summary.items()):
+        lines.append(
+            f"{name:<18} {row['count']:>6} {row['total']:>8.3f}s {row['mean']:>8.3f}s "
+            f"{row['p50']:>8.3f}s {row['p95']:>8.3f}s {row['p99']:>8.3f}s"
+        )
+    return "\n".join(lines)
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of `values`, None when empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+timings = Timings()
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block and records it under `name`.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.record(name, time.perf_counter() - started)
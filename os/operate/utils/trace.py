@@ -0,0 +1,263 @@
+"""
+Compact, append-only traces of agent runs.
+
+A trace file starts with a header (magic and codec) followed by records,
+each a kind byte, a big-endian payload length and the compressed payload.
+Records are flushed as they are written, so a trace cut short by a crash
+is still readable up to its last complete record.
+
+Frames are stored as keyframes (a full PNG) or deltas (a PNG of the
+bounding box that changed since the previous frame). Everything else is
+JSON: the run metadata, model exchanges, parsed actions and timings.
+"""
+
+import io
+import json
+import os
+import platform
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+MAGIC = b"MJAKTRC1"
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+META = 1
+KEYFRAME = 2
+DELTA = 3
+MODEL = 4
+ACTIONS = 5
+TIMELINE = 6
+END = 7
+
+KIND_NAMES = {
+    META: "meta",
+    KEYFRAME: "keyframe",
+    DELTA: "delta",
+    MODEL: "model",
+    ACTIONS: "actions",
+    TIMELINE: "timeline",
+    END: "end",
+}
+
+_RECORD_HEADER = struct.Struct(">BI")
+_DELTA_HEADER = struct.Struct(">HHHH")
+
+# A keyframe is written at least this often, and whenever the changed area
+# covers more than KEYFRAME_AREA of the frame
+KEYFRAME_INTERVAL = 10
+KEYFRAME_AREA = 0.5
+
+
+def _codec(prefer_zstd=True):
+    # zstandard is optional, zlib from the standard library is the fallback
+    if prefer_zstd:
+        try:
+            import zstandard
+
+            return CODEC_ZSTD, zstandard.ZstdCompressor(level=10).compress
+        except ImportError:
+            pass
+    return CODEC_ZLIB, lambda data: zlib.compress(data, 6)
+
+
+def _decompressor(codec):
+    if codec == CODEC_ZSTD:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+def _png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def trace_path(directory, objective):
+    """
+    Returns a new trace file path in `directory` named after the objective.
+    A random suffix keeps runs of the same objective within a second apart.
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", objective.lower()).strip("-")[:40] or "objective"
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}.mjtrace"
+    return os.path.join(directory, name)
+
+
+class TraceRecorder:
+    """
+    Writes the trace of one objective.
+
+    Usage:
+        with TraceRecorder(path, objective, model) as trace:
+            frame = trace.record_frame(screenshot)
+            trace.record_model(frame, prompt, response, latency)
+            trace.record_actions(operations, source="model")
+    """
+
+    def __init__(self, path, objective, model, settings=None, prefer_zstd=True):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        codec, self._compress = _codec(prefer_zstd)
+        # One trace per file, never appended to an existing one
+        self._file = open(path, "xb")
+        self._lock = threading.Lock()
+        self._previous = None
+        self.frames = 0
+        self._file.write(MAGIC + bytes([codec]))
+        self._write(
+            META,
+            {
+                "objective": objective,
+                "model": model,
+                "platform": platform.system(),
+                "started": time.time(),
+                "settings": settings or {},
+            },
+        )
+
+    def _write(self, kind, payload):
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload, default=str).encode("utf-8")
+        data = self._compress(payload)
+        with self._lock:
+            self._file.write(_RECORD_HEADER.pack(kind, len(data)) + data)
+            self._file.flush()
+
+    def record_frame(self, image):
+        """
+        Stores a frame as a keyframe or a delta and returns its index.
+        """
+        from PIL import ImageChops
+
+        image = image.convert("RGB")
+        box = None
+        keyframe = (
+            self._previous is None
+            or self._previous.size != image.size
+            or self.frames % KEYFRAME_INTERVAL == 0
+        )
+        if not keyframe:
+            box = ImageChops.difference(self._previous, image).getbbox()
+            if box is not None:
+                area = (box[2] - box[0]) * (box[3] - box[1])
+                keyframe = area > KEYFRAME_AREA * image.width * image.height
+        if keyframe:
+            self._write(KEYFRAME, _png(image))
+        elif box is None:
+            # Unchanged frame, an empty delta
+            self._write(DELTA, _DELTA_HEADER.pack(0, 0, 0, 0))
+        else:
+            self._write(DELTA, _DELTA_HEADER.pack(*box) + _png(image.crop(box)))
+        self._previous = image
+        self.frames += 1
+        return self.frames - 1
+
+    def record_model(self, frame, prompt, response, latency, window=None):
+        """
+        `window` is the focused window box the frame was cropped to, if any.
+        """
+        self._write(
+            MODEL,
+            {
+                "frame": frame,
+                "prompt": prompt,
+                "response": response,
+                "latency": latency,
+                "window": window,
+            },
+        )
+
+    def record_actions(self, operations, source):
+        """
+        `source` tells where the operations came from: model, prefetch or local.
+        """
+        self._write(ACTIONS, {"operations": operations, "source": source})
+
+    def record_timeline(self, timeline):
+        self._write(TIMELINE, {"entries": timeline.entries})
+
+    def record_end(self, result):
+        self._write(END, {"finished": time.time(), **result})
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_trace(path):
+    """
+    Yields (kind name, data) for every complete record of a trace. Frames
+    are rebuilt into PIL images, other records are decoded from JSON.
+    """
+    from PIL import Image
+
+    with open(path, "rb") as file:
+        header = file.read(len(MAGIC) + 1)
+        if header[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a trace file")
+        decompress = _decompressor(header[len(MAGIC)])
+        previous = None
+        while True:
+            record_header = file.read(_RECORD_HEADER.size)
+            if len(record_header) < _RECORD_HEADER.size:
+                return
+            kind, length = _RECORD_HEADER.unpack(record_header)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            payload = decompress(data)
+            if kind == KEYFRAME:
+                previous = Image.open(io.BytesIO(payload)).convert("RGB")
+                yield "frame", previous.copy()
+            elif kind == DELTA:
+                box = _DELTA_HEADER.unpack(payload[: _DELTA_HEADER.size])
+                if box != (0, 0, 0, 0):
+                    patch = Image.open(io.BytesIO(payload[_DELTA_HEADER.size:]))
+                    previous.paste(patch.convert("RGB"), box[:2])
+                yield "frame", previous.copy()
+            else:
+                yield KIND_NAMES.get(kind, str(kind)), json.loads(payload)
+
+
+def load_trace(path):
+    """
+    Reads a whole trace into {"meta", "frames", "steps", "end"}, a step
+    being {"model", "actions", "timeline"} with the parts that were recorded.
+    """
+    trace = {"meta": None, "frames": [], "steps": [], "end": None}
+    step = None
+    for kind, data in read_trace(path):
+        if kind == "meta":
+            trace["meta"] = data
+        elif kind == "frame":
+            trace["frames"].append(data)
+        elif kind == "model":
+            step = {"model": data}
+            trace["steps"].append(step)
+        elif kind == "actions":
+            if step is None or "actions" in step:
+                step = {}
+                trace["steps"].append(step)
+            step["actions"] = data
+        elif kind == "timeline":
+            if step is not None:
+                step["timeline"] = data
+            step = None
+        elif kind == "end":
+            trace["end"] = data
+    return trace
@@ -0,0 +1,98 @@
+import time
+
+from operate.action import Op
+
+# Frames are compared at this width, enough to see a focus ring or a menu
+DIFF_WIDTH = 320
+# Grayscale difference above which a pixel counts as changed
+PIXEL_THRESHOLD = 24
+
+# Retries of a click that changed nothing, small nudges (in screen
+# fractions) in case the target was just missed. Never the same point
+# again: a toggle whose change was too small to see would be undone
+RETARGET_OFFSETS = [(0.01, 0.0), (-0.01, 0.0), (0.0, 0.01), (0.0, -0.01)]
+
+# Typed text and most key presses change too few pixels to be told from
+# noise, only clicks are checked
+VERIFIED_OPERATIONS = {Op.CLICK}
+
+
+def _small_gray(image):
+    height = max(1, round(image.height * DIFF_WIDTH / image.width))
+    return image.convert("L").resize((DIFF_WIDTH, height))
+
+
+def diff_ratio(before, after, box=None):
+    """
+    Fraction of pixels that changed between two frames, within `box`
+    (left, top, right, bottom as screen fractions) when given.
+    """
+    from PIL import ImageChops
+
+    before, after = _small_gray(before), _small_gray(after)
+    if before.size != after.size:
+        return 1.0
+    if box is not None:
+        width, height = before.size
+        pixels = (
+            max(0, int(box[0] * width)),
+            max(0, int(box[1] * height)),
+            min(width, max(int(box[0] * width) + 1, int(box[2] * width))),
+            min(height, max(int(box[1] * height) + 1, int(box[3] * height))),
+        )
+        before, after = before.crop(pixels), after.crop(pixels)
+    histogram = ImageChops.difference(before, after).histogram()
+    total = sum(histogram)
+    return sum(histogram[PIXEL_THRESHOLD:]) / total if total else 0.0
+
+
+def click_box(x, y, radius):
+    return (x - radius, y - radius, x + radius, y + radius)
+
+
+class ActionVerifier:
+    """
+    Tells whether an executed operation visibly changed the screen by
+    comparing the frames before and after it, around the click target and
+    globally, without a model call.
+    """
+
+    def __init__(
+        self,
+        capture,
+        delay=0.3,
+        radius=0.05,
+        local_threshold=0.02,
+        global_threshold=0.002,
+    ):
+        self._capture = capture
+        self.delay = delay
+        self.radius = radius
+        self.local_threshold = local_threshold
+        self.global_threshold = global_threshold
+
+    def capture(self):
+        try:
+            return self._capture()
+        except Exception as e:
+            print("[ActionVerifier][capture] error:", e)
+            return None
+
+    def check(self, before, x=None, y=None):
+        """
+        Waits for the screen to settle, captures it and compares it with
+        `before`. Returns (verification, frame) where verification is
+        {"changed", "local", "global"} or None when a frame is missing.
+        """
+        time.sleep(self.delay)
+        after = self.capture()
+        if before is None or after is None:
+            return None, after
+        global_ratio = diff_ratio(before, after)
+        local_ratio = None
+        if x is not None and y is not None:
+            local_ratio = diff_ratio(before, after, click_box(x, y, self.radius))
+        changed = global_ratio >= self.global_threshold or (
+            local_ratio is not None and local_ratio >= self.local_threshold
+        )
+        return {"changed": changed, "local": local_ratio, "global": global_ratio}, after
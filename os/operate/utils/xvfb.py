@@ -0,0 +1,77 @@
+import os
+import shutil
+import subprocess
+
+
+class Xvfb:
+    """
+    Starts a headless X server on a free display number.
+
+    Usage:
+        with Xvfb() as xvfb:
+            env = dict(os.environ, DISPLAY=xvfb.display)
+    """
+
+    def __init__(self, width=1920, height=1080, depth=24):
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.display = None
+        self._process = None
+
+    @staticmethod
+    def available():
+        return shutil.which("Xvfb") is not None
+
+    def start(self):
+        if not self.available():
+            raise RuntimeError("Xvfb is not installed")
+        # -displayfd makes Xvfb pick a free display and write its number to
+        # the pipe once it is ready to accept connections
+        read_fd, write_fd = os.pipe()
+        try:
+            self._process = subprocess.Popen(
+                [
+                    "Xvfb",
+                    "-displayfd",
+                    str(write_fd),
+                    "-screen",
+                    "0",
+                    f"{self.width}x{self.height}x{self.depth}",
+                    "-nolisten",
+                    "tcp",
+                ],
+                pass_fds=(write_fd,),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            os.close(write_fd)
+            write_fd = None
+            with os.fdopen(read_fd) as pipe:
+                read_fd = None
+                number = pipe.readline().strip()
+        finally:
+            for fd in (read_fd, write_fd):
+                if fd is not None:
+                    os.close(fd)
+        if not number:
+            self.stop()
+            raise RuntimeError("Xvfb failed to start")
+        self.display = f":{number}"
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+        self.display = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
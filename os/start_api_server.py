@@ -5,6 +5,7 @@ Startup script for MJAK Automation API Server
 This script ensures all dependencies are installed and starts the FastAPI server
 """
 
+import argparse
 import sys
 import subprocess
 import os
@@ -52,14 +53,25 @@ def check_config():
 
 def main():
     """Main function to start the API server"""
+    parser = argparse.ArgumentParser(description="Start the MJAK Automation API Server")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        default=os.getenv("MJAK_PRODUCTION") == "1",
+        help="Skip the runtime pip installs and auto-reload (also MJAK_PRODUCTION=1)",
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
     logger.info("Starting MJAK Automation API Server...")
     
     # Change to the script directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
     
-    # Install requirements
-    if not install_requirements():
+    # Install requirements, production images are expected to ship them
+    if not args.production and not install_requirements():
         logger.error("Failed to install requirements. Exiting.")
         sys.exit(1)
     
@@ -70,15 +82,15 @@ def main():
     
     # Start the API server
     try:
-        logger.info("Starting FastAPI server on http://localhost:8000")
-        logger.info("API Documentation available at: http://localhost:8000/docs")
+        logger.info(f"Starting FastAPI server on http://localhost:{args.port}")
+        logger.info(f"API Documentation available at: http://localhost:{args.port}/docs")
         
         import uvicorn
         uvicorn.run(
             "api_server:app",
-            host="0.0.0.0",
-            port=8000,
-            reload=True,
+            host=args.host,
+            port=args.port,
+            reload=not args.production,
             log_level="info"
         )
     except KeyboardInterrupt: